@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import socket
+import struct
+import time
+
+from records import ServerStatus
+from targets import parse_hosts, parse_ports, iter_targets, count_hosts, count_ports
+
+# Bedrock Edition отвечает на RakNet unconnected ping по UDP без установки соединения.
+# Все запросы уходят с одного сокета, ответы сопоставляются по адресу отправителя:
+# на цель не заводится ни соединение, ни состояние, поэтому полный диапазон портов
+# проходится за секунды
+BEDROCK_PORT = 19132
+RAKNET_MAGIC = bytes.fromhex("00ffff00fefefefefdfdfdfd12345678")
+UNCONNECTED_PING = 0x01
+UNCONNECTED_PONG = 0x1C
+PING = struct.Struct(">BQ")  # id, время отправки
+PONG = struct.Struct(">BQQ16sH")  # id, время из запроса, GUID сервера, magic, длина строки
+
+# Время в запросе: старшие 16 бит - метка сканирования (чужие и старые ответы
+# отбрасываются), младшие 48 - микросекунды от начала, из них считается пинг
+STAMP_BITS = 48
+STAMP_MASK = (1 << STAMP_BITS) - 1
+
+def parse_pong(data):
+    # (время из запроса, поля строки "MCPE;MOTD;протокол;версия;...") или None
+    if len(data) < PONG.size or data[0] != UNCONNECTED_PONG:
+        return None
+    _, stamp, _, magic, length = PONG.unpack_from(data)
+    if magic != RAKNET_MAGIC:
+        return None
+    text = data[PONG.size:PONG.size + length].decode("utf-8", "replace")
+    return stamp, text.split(";")
+
+def pong_to_status(ip, port, fields, ping):
+    # MCPE;MOTD;протокол;версия;игроки;максимум;id сервера;мир;режим;...
+    def field(i):
+        return fields[i] if len(fields) > i else ""
+
+    def number(i):
+        try:
+            return int(field(i))
+        except ValueError:
+            return None
+
+    edition = field(0)
+    return ServerStatus(ip, port, field(1), field(3), number(2), number(4) or 0, number(5) or 0,
+                        core="Education" if edition == "MCEE" else "Bedrock", ping=ping, map=field(7) or None)
+
+class PongProtocol(asyncio.DatagramProtocol):
+    def __init__(self, cookie, started, on_pong):
+        self.cookie = cookie
+        self.started = started
+        self.on_pong = on_pong
+
+    def datagram_received(self, data, addr):
+        parsed = parse_pong(data)
+        if parsed is None:
+            return
+        stamp, fields = parsed
+        if stamp >> STAMP_BITS != self.cookie:
+            return
+        ping = (time.monotonic() - self.started) * 1000 - (stamp & STAMP_MASK) / 1000
+        self.on_pong(addr[0], addr[1], fields, max(ping, 0.0))
+
+    def error_received(self, exc):
+        # ICMP "порт недоступен" на закрытых портах - обычное дело для UDP
+        logging.debug(f"Bedrock socket error: {exc}", extra={"aggregate": "bedrock socket errors"})
+
+async def open_socket(family, protocol, rcvbuf=4 << 20):
+    # Большой приемный буфер: ответы на пачку запросов приходят почти одновременно
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    except OSError:
+        pass
+    sock.setblocking(False)
+    sock.bind(("::" if family == socket.AF_INET6 else "0.0.0.0", 0))
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: protocol, sock=sock)
+    return transport
+
+async def iter_bedrock_scan(targets, timeout=1.0, rate=20000, progress=None, stats=None, batch=256):
+    # Асинхронный генератор, как scanner_async.iter_scan: отдает ServerStatus по мере ответов.
+    # rate - запросов в секунду; после последнего запроса ответы ждутся timeout секунд.
+    # progress (ScanProgress) считает отправленные запросы и найденные серверы
+    loop = asyncio.get_running_loop()
+    found = asyncio.Queue()
+    done = object()
+    seen = set()
+    cookie = int.from_bytes(os.urandom(2), "big")
+    started = time.monotonic()
+    request_tail = RAKNET_MAGIC + os.urandom(8)  # magic + GUID клиента
+
+    def on_pong(ip, port, fields, ping):
+        if (ip, port) in seen:
+            return
+        seen.add((ip, port))
+        if progress is not None:
+            progress.found += 1
+        found.put_nowait(pong_to_status(ip, port, fields, ping))
+
+    protocol = PongProtocol(cookie, started, on_pong)
+    transports = {}  # семейство адресов -> транспорт; для IPv4 это один сокет на все сканирование
+    resolved = {}
+
+    async def address(host):
+        if host not in resolved:
+            try:
+                info = await loop.getaddrinfo(host, None, type=socket.SOCK_DGRAM)
+                resolved[host] = info[0][4][0]
+            except OSError as e:
+                if stats:
+                    stats.record_failure("bedrock", "dns")
+                logging.warning(f"Не удалось разрешить {host}: {e}")
+                resolved[host] = None
+        return resolved[host]
+
+    async def send_all():
+        sent = 0
+        for host, port in targets:
+            ip = await address(host)
+            if ip is not None:
+                family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+                transport = transports.get(family)
+                if transport is None:
+                    transport = transports[family] = await open_socket(family, protocol)
+                stamp = cookie << STAMP_BITS | int((time.monotonic() - started) * 1e6) & STAMP_MASK
+                transport.sendto(PING.pack(UNCONNECTED_PING, stamp) + request_tail, (ip, port))
+                sent += 1
+            if progress is not None:
+                progress.advance()
+            if sent and sent % batch == 0:
+                # Темп не выше rate и без переполнения буфера отправки
+                delay = started + sent / rate - time.monotonic()
+                await asyncio.sleep(max(0.0, delay))
+                while any(t.get_write_buffer_size() > 1 << 20 for t in transports.values()):
+                    await asyncio.sleep(0.001)
+        await asyncio.sleep(timeout)  # опоздавшие ответы
+
+    async def run():
+        try:
+            await send_all()
+        finally:
+            for transport in transports.values():
+                transport.close()
+            found.put_nowait(done)
+
+    sender = asyncio.create_task(run())
+    try:
+        while True:
+            result = await found.get()
+            if result is done:
+                break
+            yield result
+        await sender
+    finally:
+        sender.cancel()
+
+async def scan_bedrock(ip, ports=str(BEDROCK_PORT), timeout=1.0, rate=20000, progress=None, stats=None):
+    # Как scanner_async.scan_ports, но для Bedrock: список найденных серверов
+    hosts = parse_hosts(ip)
+    ports = parse_ports(ports)
+    if progress is not None and progress.total is None:
+        progress.total = count_hosts(hosts) * count_ports(ports)
+    results = [r async for r in iter_bedrock_scan(iter_targets(hosts, ports), timeout=timeout, rate=rate,
+                                                  progress=progress, stats=stats)]
+    logging.info(f"Bedrock scan completed: {len(results)} servers found")
+    return results
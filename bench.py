@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from functools import partial
+
+from raw_status import RawStatusProber, encode_varint, read_varint
+from scanner_async import scan_port_async
+
+# Сравнение запроса статуса через mcstatus (scan_port_async) и raw_status.RawStatusProber
+# на локальном поддельном сервере, который работает в отдельном процессе:
+#   python3 bench.py -n 5000 -c 100 --mods 50
+FAVICON = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+
+def status_payload(mods=0, players=12):
+    status = {
+        "version": {"name": "Paper 1.20.4", "protocol": 765},
+        "players": {"max": 100, "online": players,
+                    "sample": [{"name": f"player{i}", "id": "00000000-0000-0000-0000-000000000000"}
+                               for i in range(players)]},
+        "description": {"text": "Bench ", "color": "green", "extra": [{"text": "server", "bold": True}]},
+        "favicon": FAVICON,
+    }
+    if mods:
+        status["forgeData"] = {"channels": [], "fmlNetworkVersion": 2,
+                               "mods": [{"modId": f"mod{i}", "modmarker": "1.0"} for i in range(mods)]}
+    data = json.dumps(status).encode("utf-8")
+    body = b"\x00" + encode_varint(len(data)) + data
+    return encode_varint(len(body)) + body
+
+async def read_packet(reader):
+    header = bytearray()
+    while True:
+        header += await reader.readexactly(1)
+        parsed = read_varint(header, 0, len(header))
+        if parsed is not None:
+            return await reader.readexactly(parsed[0])
+
+def run_server(ready, mods):
+    response = status_payload(mods)
+
+    async def handle(reader, writer):
+        try:
+            await read_packet(reader)  # рукопожатие
+            await read_packet(reader)  # запрос статуса
+            writer.write(response)
+            await writer.drain()
+            ping = await read_packet(reader)  # mcstatus после статуса еще меряет пинг
+            writer.write(encode_varint(len(ping)) + ping)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0, backlog=4096)
+        ready.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+async def run_probes(probe, port, count, concurrency, timeout):
+    results = []
+    queue = iter(range(count))
+
+    async def worker():
+        for _ in queue:
+            results.append(await probe("127.0.0.1", port, timeout))
+
+    started, cpu = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - started, time.process_time() - cpu
+
+def comparable(result):
+    data = result.to_dict()
+    data.pop("ping")
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк запроса статуса: mcstatus против raw_status")
+    parser.add_argument("-n", "--count", type=int, default=2000, help="запросов на каждую реализацию")
+    parser.add_argument("-c", "--concurrency", type=int, default=50, help="одновременных запросов")
+    parser.add_argument("-t", "--timeout", type=float, default=5.0, help="таймаут запроса, сек")
+    parser.add_argument("--mods", type=int, default=0, help="модов Forge в ответе (размер ответа)")
+    args = parser.parse_args()
+
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_server, args=(ready, args.mods), daemon=True)
+    server.start()
+    port = ready.get(timeout=10)
+    probes = {"mcstatus": partial(scan_port_async, retries=1), "raw": RawStatusProber(retries=1)}
+    print(f"Ответ сервера: {len(status_payload(args.mods))} байт, запросов: {args.count}, "
+          f"одновременно: {args.concurrency}")
+    reference = None
+    try:
+        for name, probe in probes.items():
+            results, elapsed, cpu = asyncio.run(run_probes(probe, port, args.count, args.concurrency, args.timeout))
+            ok = [r for r in results if r is not None]
+            pings = sorted(r.ping for r in ok)
+            median = pings[len(pings) // 2] if pings else float("nan")
+            print(f"{name:>8}: {len(ok) / elapsed:8.0f} запросов/с, CPU {cpu / max(len(ok), 1) * 1e6:6.0f} мкс "
+                  f"на запрос, медианный пинг {median:.2f} мс, ошибок {len(results) - len(ok)}")
+            if ok:
+                reference = reference or comparable(ok[0])
+                if comparable(ok[0]) != reference:
+                    print(f"{name:>8}: результат отличается от mcstatus: {comparable(ok[0])}")
+    finally:
+        server.terminate()
+
+if __name__ == "__main__":
+    main()
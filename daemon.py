@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from scanner_async import scan_ports, iter_scan, ScanStats, ScanProgress
+from scan_service import RescanPlan
+from store import ResultStore
+from records import to_json, favicon_store, set_favicon_store, register_favicon
+from favicons import FaviconStore
+from targets import parse_hosts, parse_ports, count_hosts, count_ports
+from logsetup import setup_logging
+
+# Фоновый режим без интерфейса: периодические проходы по заданным целям
+# и локальный HTTP/JSON API для дашбордов. Запросы к API только читают
+# базу и никогда не запускают сканирование
+MAX_PAGE = 1000
+
+class ScanDaemon:
+    def __init__(self, hosts, ports, store, interval=300.0, full_interval=3600.0, tiered=True,
+                 timeout=2.0, concurrency=50, connect_timeout=0.5, connect_concurrency=1000, per_host_limit=None,
+                 **stages):
+        # stages - стадии legacy/query движка (см. scanner_async.scan_pipeline)
+        self.hosts = hosts
+        self.ports = ports
+        self.store = store
+        self.interval = interval
+        self.plan = RescanPlan(full_interval, tiered=tiered)
+        self.scan_options = dict(timeout=timeout, concurrency=concurrency, connect_timeout=connect_timeout,
+                                 connect_concurrency=connect_concurrency, per_host_limit=per_host_limit, **stages)
+        self.total_ports = count_hosts(parse_hosts(hosts)) * count_ports(parse_ports(ports))
+        self.progress = None  # ScanProgress идущего прохода
+        self.mode = None
+        self.last_sweep = None
+        self.next_sweep = None
+
+    async def run(self):
+        # Проходы идут строго друг за другом: следующий начинается не раньше,
+        # чем закончится предыдущий, даже если он длиннее интервала
+        while True:
+            started = time.monotonic()
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.error(f"Ошибка прохода: {e}")
+            delay = max(0.0, self.interval - (time.monotonic() - started))
+            self.next_sweep = time.time() + delay
+            await asyncio.sleep(delay)
+
+    async def sweep(self):
+        now = time.monotonic()
+        self.mode = self.plan.due(now)
+        if self.mode == "hot" and not self.plan.hot:
+            logging.info("Горячих портов нет, ждем полного прохода")
+            return
+        stats = ScanStats()
+        started = time.monotonic()
+        if self.mode == "full":
+            self.progress = ScanProgress(self.total_ports)
+            results = await scan_ports(self.hosts, ports=self.ports, stats=stats, progress=self.progress,
+                                       **self.scan_options)
+            self.plan.record_full(now, [(r["ip"], r["port"]) for r in results])
+        else:
+            hot = self.plan.hot_targets()
+            self.progress = ScanProgress(len(hot))
+            results = [r async for r in iter_scan(hot, stats=stats, progress=self.progress, **self.scan_options)]
+            self.plan.record_hot(hot, [(r["ip"], r["port"]) for r in results])
+        await asyncio.to_thread(self.store.add_scan, self.hosts, self.ports, results, mode=self.mode)
+        self.last_sweep = {
+            "mode": self.mode,
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "servers": len(results),
+            "probes": self.progress.completed,
+            "seconds": round(time.monotonic() - started, 1),
+        }
+        self.progress = None
+        logging.info(f"Проход ({self.mode}) завершен: {len(results)} серверов за {self.last_sweep['seconds']} сек")
+        if stats.failures:
+            logging.info(f"Неудачные попытки: {stats.failure_summary()}")
+
+    def status(self):
+        status = {
+            "targets": self.hosts,
+            "ports": self.ports,
+            "interval": self.interval,
+            "full_interval": self.plan.full_interval,
+            "hot": len(self.plan.hot),
+            "last_sweep": self.last_sweep,
+            "next_sweep": datetime.fromtimestamp(self.next_sweep).strftime("%Y-%m-%d %H:%M:%S") if self.next_sweep else None,
+            "running": None,
+        }
+        progress = self.progress
+        if progress is not None:
+            percent, rate, eta = progress.sample()
+            status["running"] = {"mode": self.mode, "percent": round(percent, 1), "probes_per_second": round(rate),
+                                 "eta": round(eta) if eta is not None else None, "found": progress.found}
+        return status
+
+def page_params(query):
+    try:
+        offset = max(0, int(query.get("offset", ["0"])[0]))
+        limit = min(MAX_PAGE, max(1, int(query.get("limit", ["100"])[0])))
+    except ValueError:
+        raise ValueError("offset и limit должны быть числами")
+    return offset, limit
+
+def page(items, offset, limit, total=None):
+    body = {"offset": offset, "limit": limit, "items": items}
+    if total is not None:
+        body["total"] = total
+    more = offset + limit < total if total is not None else len(items) == limit
+    body["next_offset"] = offset + limit if more else None
+    return body
+
+class ApiHandler(BaseHTTPRequestHandler):
+    # GET /status                      - состояние планировщика и идущего прохода
+    # GET /latest?offset=&limit=       - результаты последнего прохода
+    # GET /scans?offset=&limit=        - история проходов, новые первыми
+    # GET /scans/<id>?offset=&limit=   - результаты одного прохода
+    # GET /servers/<ip>/<port>?...     - временной ряд наблюдений сервера
+    # GET /favicons/<hash>             - иконка сервера (PNG)
+    # Ответы с данными из базы снабжены ETag: база только дополняется, поэтому
+    # версия - номер последнего прохода, и повторный опрос без изменений
+    # стоит одного запроса MAX(id) и ответа 304
+    server_version = "mcscan-daemon"
+    routes = [
+        (re.compile(r"^/status$"), "get_status"),
+        (re.compile(r"^/latest$"), "get_latest"),
+        (re.compile(r"^/scans$"), "get_scans"),
+        (re.compile(r"^/scans/(\d+)$"), "get_scan"),
+        (re.compile(r"^/servers/([^/]+)/(\d+)$"), "get_server"),
+        (re.compile(r"^/favicons/([0-9a-f]{40})$"), "get_favicon"),
+    ]
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        for pattern, name in self.routes:
+            match = pattern.match(url.path)
+            if match:
+                try:
+                    getattr(self, name)(query, *[unquote(group) for group in match.groups()])
+                except ValueError as e:
+                    self.send_json({"error": str(e)}, status=400)
+                except Exception as e:
+                    logging.error(f"Ошибка API {self.path}: {e}")
+                    self.send_json({"error": "internal error"}, status=500)
+                return
+        self.send_json({"error": "not found"}, status=404)
+
+    @property
+    def scan_daemon(self):
+        return self.server.scan_daemon
+
+    def not_modified(self, etag):
+        # Условный запрос: у клиента актуальная версия - тело не формируем вовсе
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return True
+        return False
+
+    def data_etag(self):
+        return f'"{self.scan_daemon.store.latest_scan_id()}"'
+
+    def get_status(self, query):
+        self.send_json(self.scan_daemon.status(), cache="no-store")
+
+    def get_latest(self, query):
+        etag = self.data_etag()
+        if self.not_modified(etag):
+            return
+        scan = self.scan_daemon.store.latest_scan()
+        if scan is None:
+            self.send_json({"error": "no scans yet"}, status=404)
+            return
+        self.send_scan(scan, query, etag)
+
+    def get_scan(self, query, scan_id):
+        etag = self.data_etag()
+        if self.not_modified(etag):
+            return
+        scan = self.scan_daemon.store.get_scan(int(scan_id))
+        if scan is None:
+            self.send_json({"error": "scan not found"}, status=404)
+            return
+        self.send_scan(scan, query, etag)
+
+    def send_scan(self, scan, query, etag):
+        offset, limit = page_params(query)
+        items = self.scan_daemon.store.load_scan(scan["id"], offset, limit, favicons=False)
+        self.send_json(dict(page(items, offset, limit, scan["servers"]), scan=scan), etag=etag)
+
+    def get_scans(self, query):
+        etag = self.data_etag()
+        if self.not_modified(etag):
+            return
+        offset, limit = page_params(query)
+        store = self.scan_daemon.store
+        self.send_json(page(store.list_scans(offset, limit), offset, limit, store.count_scans()), etag=etag)
+
+    def get_server(self, query, ip, port):
+        etag = self.data_etag()
+        if self.not_modified(etag):
+            return
+        offset, limit = page_params(query)
+        items = self.scan_daemon.store.server_history(ip, int(port), offset, limit)
+        self.send_json(dict(page(items, offset, limit), ip=ip, port=int(port)), etag=etag)
+
+    def get_favicon(self, query, icon_hash):
+        # Содержимое иконки определяется ее хешем и никогда не меняется
+        etag = f'"{icon_hash}"'
+        if self.not_modified(etag):
+            return
+        # Сначала - уже декодированный PNG из хранилища иконок, иначе - из базы
+        png = favicon_store().png(icon_hash)
+        if png is None:
+            favicon = self.scan_daemon.store.get_favicon(icon_hash)
+            if favicon:
+                png = favicon_store().png(register_favicon(favicon, icon_hash))
+        if png is None:
+            self.send_json({"error": "favicon not found"}, status=404)
+            return
+        self.send_body(png, "image/png", etag=etag, cache="public, max-age=31536000, immutable")
+
+    def send_json(self, body, status=200, etag=None, cache="no-cache"):
+        data = json.dumps(body, ensure_ascii=False, separators=(",", ":"), default=to_json).encode("utf-8")
+        self.send_body(data, "application/json; charset=utf-8", status, etag, cache)
+
+    def send_body(self, data, content_type, status=200, etag=None, cache="no-cache"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", cache)
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(f"API {self.address_string()} {format % args}")
+
+def start_api(scan_daemon, host="127.0.0.1", port=8765):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.scan_daemon = scan_daemon
+    threading.Thread(target=server.serve_forever, name="api", daemon=True).start()
+    logging.info(f"API доступен на http://{host}:{port}")
+    return server
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Фоновое сканирование Minecraft-серверов с HTTP/JSON API")
+    parser.add_argument("targets", help="цели: IP, подсети, диапазоны, имена хостов, @файл")
+    parser.add_argument("-p", "--ports", default="25565", help="порты, например 25565,36000-50000")
+    parser.add_argument("--interval", type=float, default=5, help="минут между проходами (по умолчанию 5)")
+    parser.add_argument("--full-interval", type=float, default=60,
+                        help="минут между полными проходами; между ними перепроверяются только найденные серверы")
+    parser.add_argument("--no-tiered", action="store_true", help="каждый проход - по всему диапазону")
+    parser.add_argument("--db", default="history.db", help="файл базы истории")
+    parser.add_argument("--log", default="scanner.log", help="файл лога (пишется и в stderr)")
+    parser.add_argument("--favicon-dir", help="каталог, где хранить иконки декодированными PNG")
+    parser.add_argument("--listen", default="127.0.0.1", help="адрес HTTP API")
+    parser.add_argument("--api-port", type=int, default=8765, help="порт HTTP API")
+    parser.add_argument("--timeout", type=float, default=2.0, help="таймаут запроса статуса, сек")
+    parser.add_argument("--connect-timeout", type=float, default=0.5, help="таймаут TCP-подключения, сек")
+    parser.add_argument("-c", "--concurrency", type=int, default=50, help="одновременных запросов статуса")
+    parser.add_argument("--connect-concurrency", type=int, default=1000, help="одновременных TCP-подключений")
+    parser.add_argument("--per-host-limit", type=int, default=None, help="максимум одновременных проверок одного хоста")
+    parser.add_argument("--legacy", action="store_true",
+                        help="старый пинг 0xFE для открытых портов без ответа на статус (серверы до 1.7)")
+    parser.add_argument("--query", action="store_true",
+                        help="UDP Query для найденных серверов: плагины, карта, все игроки")
+    parser.add_argument("--query-timeout", type=float, default=1.0, help="таймаут UDP Query и старого пинга, сек")
+    parser.add_argument("--query-concurrency", type=int, default=20,
+                        help="одновременных запросов UDP Query и старого пинга")
+    parser.add_argument("--favicon-retry", action="store_true",
+                        help="повторный запрос статуса ради favicon, если сервер ответил без иконки")
+    args = parser.parse_args(argv)
+    try:
+        parse_hosts(args.targets)
+        parse_ports(args.ports)
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+    return args
+
+async def main(argv=None):
+    args = parse_args(argv)
+    setup_logging(args.log, stream=True)
+    if args.favicon_dir:
+        set_favicon_store(FaviconStore(args.favicon_dir))
+    store = ResultStore(args.db)
+    scan_daemon = ScanDaemon(args.targets, args.ports, store, interval=args.interval * 60,
+                             full_interval=args.full_interval * 60, tiered=not args.no_tiered,
+                             timeout=args.timeout, concurrency=args.concurrency,
+                             connect_timeout=args.connect_timeout, connect_concurrency=args.connect_concurrency,
+                             per_host_limit=args.per_host_limit, legacy=args.legacy,
+                             legacy_timeout=args.query_timeout, legacy_concurrency=args.query_concurrency,
+                             query=args.query, query_timeout=args.query_timeout,
+                             query_concurrency=args.query_concurrency, favicon_retry=args.favicon_retry)
+    server = start_api(scan_daemon, args.listen, args.api_port)
+    try:
+        await scan_daemon.run()
+    finally:
+        server.shutdown()
+        store.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
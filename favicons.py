@@ -0,0 +1,124 @@
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PNG_PREFIX = "data:image/png;base64,"
+
+def favicon_hash(data):
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+class FaviconStore:
+    # Хранилище favicon по содержимому: хеш -> строка data:image/png;base64,...
+    # Одинаковые иконки хранятся один раз, записи о серверах ссылаются на них по хешу.
+    # С directory иконки еще и кладутся на диск уже декодированными (<хеш>.png):
+    # интерфейс и API берут PNG оттуда, не декодируя base64 каждый раз.
+    # В памяти держатся не больше max_items последних иконок (LRU): демон и GUI работают
+    # долго, а вытесненную иконку при directory можно снова прочитать с диска.
+    # PNG пишет отдельный поток - put вызывается из цикла событий при создании записи
+    def __init__(self, directory=None, max_items=4096):
+        self.directory = directory
+        self.max_items = max_items
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.writer = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="favicons")
+
+    def __len__(self):
+        return len(self.data)
+
+    def items(self):
+        with self.lock:
+            return list(self.data.items())
+
+    def put(self, favicon, key=None):
+        # key - уже известный хеш (из базы или файла), тогда строка заново не хешируется
+        if not favicon or not isinstance(favicon, str):
+            return key
+        key = key or favicon_hash(favicon)
+        new = self._remember(key, favicon)
+        if new and self.writer is not None:
+            self.writer.submit(self._write_png, key, favicon)
+        return key
+
+    def _remember(self, key, favicon):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                return False
+            self.data[key] = favicon
+            if self.max_items and len(self.data) > self.max_items:
+                self.data.popitem(last=False)
+            return True
+
+    def get(self, key):
+        if not key:
+            return None
+        with self.lock:
+            favicon = self.data.get(key)
+            if favicon is not None:
+                self.data.move_to_end(key)
+        if favicon is None:
+            # Иконка из прошлого запуска или вытесненная из памяти: есть только PNG на диске
+            png = self._read_png(key)
+            if png is not None:
+                favicon = PNG_PREFIX + base64.b64encode(png).decode("ascii")
+                self._remember(key, favicon)
+        return favicon
+
+    def path(self, key):
+        # Путь к декодированному PNG, если он есть на диске
+        if not (key and self.directory):
+            return None
+        path = os.path.join(self.directory, f"{key}.png")
+        return path if os.path.exists(path) else None
+
+    def png(self, key):
+        png = self._read_png(key)
+        if png is not None:
+            return png
+        with self.lock:
+            favicon = self.data.get(key)
+        if not favicon:
+            return None
+        png = decode_png(favicon)
+        if png is not None and self.directory:
+            self._write_png(key, favicon, png)
+        return png
+
+    def _read_png(self, key):
+        path = self.path(key)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _write_png(self, key, favicon, png=None):
+        png = png if png is not None else decode_png(favicon)
+        if png is None:
+            return
+        path = os.path.join(self.directory, f"{key}.png")
+        if os.path.exists(path):
+            return
+        # Запись через временный файл: читатель не увидит недописанный PNG
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(png)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.error(f"Не удалось сохранить favicon {key}: {e}")
+
+def decode_png(favicon):
+    if not favicon.startswith(PNG_PREFIX):
+        return None
+    try:
+        return base64.b64decode(favicon[len(PNG_PREFIX):])
+    except (binascii.Error, ValueError):
+        return None
@@ -2,23 +2,89 @@ import tkinter as tk
 from tkinter import ttk, messagebox, Text
 from PIL import Image, ImageTk
 import base64
-import threading
 from io import BytesIO
 from datetime import datetime
 import json
 import os
 import logging
 import asyncio
-
-from scanner_async import scan_ports  # Асинхронный сканер
-
-# Настройка логирования
-logging.basicConfig(
-    filename="scanner.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    encoding="utf-8"
-)
+import time
+from collections import OrderedDict
+
+from scanner_async import iter_scan, ScanStats, ScanProgress  # Асинхронный сканер
+from bedrock import iter_bedrock_scan
+from output import ResultWriter, iter_results_file
+from store import ResultStore
+from records import ServerStatus, get_favicon, favicon_store, set_favicon_store
+from favicons import FaviconStore
+from result_index import ResultIndex, make_filter, strip_color_codes
+from scan_service import ScanService, UiPump, RescanPlan
+from logsetup import setup_logging
+from targets import parse_hosts, parse_ports, iter_targets, count_hosts, count_ports
+
+PROGRESS_INTERVAL = 200  # мс между обновлениями прогресса в интерфейсе
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+class FaviconCache:
+    # LRU-кэш: хеш favicon -> готовый PhotoImage. Одинаковые иконки (частый случай
+    # для серверов одного хоста) декодируются один раз, а уже виденные - при
+    # перерисовке вообще не требуют работы с изображениями. Готовые миниатюры
+    # сохраняются на диск и переживают перезапуск приложения.
+    def __init__(self, size=(64, 64), capacity=512, cache_dir="favicon_cache"):
+        self.size = size
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self.images = OrderedDict()
+        self.broken = set()
+
+    def get(self, key):
+        # key - favicon_hash записи; сама иконка нужна только при промахе кэша
+        if not key:
+            return None
+        if key in self.images:
+            self.images.move_to_end(key)
+            return self.images[key]
+        if key in self.broken:
+            return None
+        try:
+            image = self.load_thumbnail(key)
+            if image is None:
+                return None
+        except Exception as e:
+            self.broken.add(key)
+            logging.error(f"Ошибка favicon {key}: {e}")
+            return None
+        icon = ImageTk.PhotoImage(image)
+        self.images[key] = icon
+        if len(self.images) > self.capacity:
+            self.images.popitem(last=False)
+        return icon
+
+    def load_thumbnail(self, key):
+        path = os.path.join(self.cache_dir, f"{key}_{self.size[0]}.png")
+        if os.path.exists(path):
+            return Image.open(path)
+        # PNG берется из хранилища иконок: с каталогом на диске он уже декодирован
+        img_data = favicon_store().png(key)
+        if img_data is None:
+            favicon = get_favicon(key)
+            if not (favicon and favicon.startswith("data:image/")):
+                return None
+            img_data = base64.b64decode(favicon.split(",")[1])
+        image = Image.open(BytesIO(img_data)).convert("RGBA").resize(self.size)
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        composite = Image.alpha_composite(background, image)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            composite.save(path)
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить миниатюру favicon: {e}")
+        return composite
 
 class ServerScannerGUI:
     def __init__(self, root):
@@ -44,9 +110,14 @@ class ServerScannerGUI:
         self.card_bg_color = "#e0e0e0"
         self.text_color = "#000000"
         self.progress_value = 0
+        self.button_icons = {}
+        self.favicon_cache = FaviconCache()
+        # Иконки строк списка: строки ссылаются на PhotoImage по имени, поэтому кэш больше основного
+        self.row_favicons = FaviconCache(size=(24, 24), capacity=4096)
 
         # Загрузка избранных серверов (с тегами)
         self.favorites = list({(f['ip'], f['port']): f for f in self.load_favorites()}.values())
+        self.fav_last_results = {}  # (ip, port) -> последний успешный ответ избранного сервера
 
         # Основной фрейм с вкладками
         self.notebook = ttk.Notebook(root)
@@ -81,7 +152,7 @@ class ServerScannerGUI:
         frame_top = tk.Frame(self.main_frame, bg=self.bg_color)
         frame_top.pack(pady=10, fill="x")
 
-        tk.Label(frame_top, text="IP:", bg=self.bg_color, fg=self.text_color, font=("Arial", 12)).pack(side=tk.LEFT, padx=5)
+        tk.Label(frame_top, text="IP / подсети:", bg=self.bg_color, fg=self.text_color, font=("Arial", 12)).pack(side=tk.LEFT, padx=5)
         self.entry_ip = tk.Entry(frame_top, width=20, font=("Arial", 12))
         self.entry_ip.pack(side=tk.LEFT, padx=5)
         self.entry_ip.insert(0, "147.185.221.31")
@@ -94,6 +165,23 @@ class ServerScannerGUI:
         self.btn_scan = tk.Button(frame_top, text="Сканировать", command=self.start_scan, image=self.get_icon("scan.png"), compound=tk.LEFT, font=("Arial", 10))
         self.btn_scan.pack(side=tk.LEFT, padx=5)
 
+        self.btn_stop = tk.Button(frame_top, text="Остановить", command=self.stop_scan, state=tk.DISABLED, image=self.get_icon("stop.png"), compound=tk.LEFT, font=("Arial", 10))
+        self.btn_stop.pack(side=tk.LEFT, padx=5)
+
+        # Дополнительные пробы: UDP Query (плагины, карта, все игроки) и старый пинг для серверов до 1.7
+        self.query_var = tk.BooleanVar(value=False)
+        self.legacy_var = tk.BooleanVar(value=False)
+        self.bedrock_var = tk.BooleanVar(value=False)
+        self.favicon_retry_var = tk.BooleanVar(value=False)
+        self.scan_stages = {}
+        self.scan_bedrock = False
+        tk.Checkbutton(frame_top, text="Query (UDP)", variable=self.query_var, command=self.update_scan_stages, bg=self.bg_color, fg=self.text_color, font=("Arial", 10)).pack(side=tk.LEFT)
+        tk.Checkbutton(frame_top, text="До 1.7", variable=self.legacy_var, command=self.update_scan_stages, bg=self.bg_color, fg=self.text_color, font=("Arial", 10)).pack(side=tk.LEFT)
+        # Повторный запрос статуса ради favicon, если сервер ответил без иконки
+        tk.Checkbutton(frame_top, text="Догрузка иконок", variable=self.favicon_retry_var, command=self.update_scan_stages, bg=self.bg_color, fg=self.text_color, font=("Arial", 10)).pack(side=tk.LEFT)
+        # Bedrock Edition: UDP-пинг всего диапазона с одного сокета вместо протокола Java
+        tk.Checkbutton(frame_top, text="Bedrock (UDP)", variable=self.bedrock_var, command=self.update_scan_stages, bg=self.bg_color, fg=self.text_color, font=("Arial", 10)).pack(side=tk.LEFT)
+
         # Прогресс-бар с процентами
         self.progress = ttk.Progressbar(frame_top, mode='determinate', maximum=100)
         self.progress.pack(side=tk.LEFT, padx=5)
@@ -108,9 +196,20 @@ class ServerScannerGUI:
         self.btn_import = tk.Button(frame_top, text="Импорт серверов", command=self.import_servers, image=self.get_icon("import.png"), compound=tk.LEFT, font=("Arial", 10))
         self.btn_import.pack(side=tk.LEFT, padx=5)
 
+        # Кнопка для загрузки сохраненных результатов
+        self.btn_open_results = tk.Button(frame_top, text="Открыть результаты", command=self.open_results, image=self.get_icon("open.png"), compound=tk.LEFT, font=("Arial", 10))
+        self.btn_open_results.pack(side=tk.LEFT, padx=5)
+
         # Кнопка для массовой проверки избранного
         self.btn_check_favs = tk.Button(frame_top, text="Проверить избранное", command=self.check_favorites, image=self.get_icon("check_favs.png"), compound=tk.LEFT, font=("Arial", 10))
         self.btn_check_favs.pack(side=tk.LEFT, padx=5)
+        # Избранные, успешно проверенные недавно, повторно не опрашиваются
+        self.fav_skip_fresh = tk.BooleanVar(value=False)
+        self.fav_skip_check = tk.Checkbutton(frame_top, text="Пропускать свежие (мин):", variable=self.fav_skip_fresh, bg=self.bg_color, fg=self.text_color, font=("Arial", 10))
+        self.fav_skip_check.pack(side=tk.LEFT)
+        self.fav_fresh_var = tk.StringVar(value="10")
+        self.fav_fresh_entry = tk.Entry(frame_top, textvariable=self.fav_fresh_var, width=4, font=("Arial", 10))
+        self.fav_fresh_entry.pack(side=tk.LEFT, padx=5)
 
         # Кнопка для переключения темы
         self.btn_theme = tk.Button(frame_top, text="Темная тема", command=self.toggle_theme, image=self.get_icon("theme.png"), compound=tk.LEFT, font=("Arial", 10))
@@ -125,6 +224,13 @@ class ServerScannerGUI:
         self.rescan_interval_entry = tk.Entry(frame_top, textvariable=self.rescan_interval_var, width=5, font=("Arial", 10))
         self.rescan_interval_entry.pack(side=tk.LEFT, padx=5)
         self.rescan_interval_entry.bind("<KeyRelease>", self.update_rescan_interval)
+        # Многоуровневый режим: между полными проходами перепроверяются только найденные серверы
+        self.rescan_tiered = tk.BooleanVar(value=True)
+        self.rescan_tiered_check = tk.Checkbutton(frame_top, text="Горячие порты, полный проход (мин):", variable=self.rescan_tiered, bg=self.bg_color, fg=self.text_color, font=("Arial", 10))
+        self.rescan_tiered_check.pack(side=tk.LEFT)
+        self.full_sweep_var = tk.StringVar(value="60")
+        self.full_sweep_entry = tk.Entry(frame_top, textvariable=self.full_sweep_var, width=5, font=("Arial", 10))
+        self.full_sweep_entry.pack(side=tk.LEFT, padx=5)
 
         # Панель фильтрации и сортировки
         frame_filter = tk.Frame(self.main_frame, bg=self.bg_color)
@@ -137,7 +243,7 @@ class ServerScannerGUI:
 
         tk.Label(frame_filter, text="Ядро:", bg=self.bg_color, fg=self.text_color, font=("Arial", 12)).pack(side=tk.LEFT, padx=5)
         self.core_var = tk.StringVar(value="all")
-        tk.OptionMenu(frame_filter, self.core_var, "all", "Vanilla", "Paper", "Spigot", "Forge", "Fabric", command=self.apply_filter).pack(side=tk.LEFT, padx=5)
+        tk.OptionMenu(frame_filter, self.core_var, "all", "Vanilla", "Paper", "Spigot", "Forge", "Fabric", "Bedrock", command=self.apply_filter).pack(side=tk.LEFT, padx=5)
 
         tk.Label(frame_filter, text="Версия:", bg=self.bg_color, fg=self.text_color, font=("Arial", 12)).pack(side=tk.LEFT, padx=5)
         self.version_var = tk.StringVar()
@@ -173,22 +279,25 @@ class ServerScannerGUI:
         self.main_content = tk.PanedWindow(self.main_frame, orient=tk.HORIZONTAL, bg="#d0d0d0", sashwidth=5, sashrelief="raised")
         self.main_content.pack(fill="both", expand=True)
 
-        # Левая часть: список серверов
+        # Левая часть: список серверов. Treeview создает виджеты только для видимых строк,
+        # поэтому тысячи результатов не замораживают интерфейс
         self.server_list_frame = tk.Frame(self.main_content, bg=self.bg_color, bd=2, relief="groove")
         self.main_content.add(self.server_list_frame, width=400)
 
-        self.server_canvas = tk.Canvas(self.server_list_frame, bg=self.bg_color)
-        self.server_scrollbar = ttk.Scrollbar(self.server_list_frame, orient="vertical", command=self.server_canvas.yview)
-        self.server_list = tk.Frame(self.server_canvas, bg=self.bg_color)
-
-        self.server_list.bind(
-            "<Configure>",
-            lambda e: self.server_canvas.configure(scrollregion=self.server_canvas.bbox("all"))
-        )
-        self.server_canvas.create_window((0, 0), window=self.server_list, anchor="nw")
-        self.server_canvas.configure(yscrollcommand=self.server_scrollbar.set)
-        self.server_canvas.pack(side="left", fill="both", expand=True)
-        self.server_scrollbar.pack(side="right", fill="y")
+        server_actions = tk.Frame(self.server_list_frame, bg=self.bg_color)
+        server_actions.pack(side="bottom", fill="x")
+        tk.Button(server_actions, text="Подробнее", command=lambda: self.on_selected(self.server_tree, self.show_details), image=self.get_icon("details.png"), compound=tk.LEFT, font=("Arial", 10)).pack(side=tk.LEFT, padx=2, pady=2)
+        tk.Button(server_actions, text="В избранное", command=lambda: self.on_selected(self.server_tree, self.add_to_favorites), image=self.get_icon("favorite.png"), compound=tk.LEFT, font=("Arial", 10)).pack(side=tk.LEFT, padx=2, pady=2)
+        tk.Button(server_actions, text="Копировать IP", command=lambda: self.on_selected(self.server_tree, self.copy_address), image=self.get_icon("copy.png"), compound=tk.LEFT, font=("Arial", 10)).pack(side=tk.LEFT, padx=2, pady=2)
+
+        self.tree_style = ttk.Style()
+        self.server_rows = {}  # id строки Treeview -> результат
+        self.server_tree = self.create_server_tree(self.server_list_frame, self.server_rows, [
+            ("Подробнее", self.show_details),
+            ("В избранное", self.add_to_favorites),
+            ("Копировать IP", self.copy_address),
+        ])
+        self.render_jobs = {}
 
         # Правая часть: подробная информация
         self.details_frame = tk.Frame(self.main_content, bg=self.details_bg_color, bd=2, relief="groove")
@@ -199,23 +308,36 @@ class ServerScannerGUI:
         # Вкладка избранного
         self.fav_list_frame = tk.Frame(self.fav_frame, bg=self.bg_color, bd=2, relief="groove")
         self.fav_list_frame.pack(fill="both", expand=True)
-        self.fav_canvas = tk.Canvas(self.fav_list_frame, bg=self.bg_color)
-        self.fav_scrollbar = ttk.Scrollbar(self.fav_list_frame, orient="vertical", command=self.fav_canvas.yview)
-        self.fav_list = tk.Frame(self.fav_canvas, bg=self.bg_color)
 
-        self.fav_list.bind(
-            "<Configure>",
-            lambda e: self.fav_canvas.configure(scrollregion=self.fav_canvas.bbox("all"))
-        )
-        self.fav_canvas.create_window((0, 0), window=self.fav_list, anchor="nw")
-        self.fav_canvas.configure(yscrollcommand=self.fav_scrollbar.set)
-        self.fav_canvas.pack(side="left", fill="both", expand=True)
-        self.fav_scrollbar.pack(side="right", fill="y")
+        fav_actions = tk.Frame(self.fav_list_frame, bg=self.bg_color)
+        fav_actions.pack(side="bottom", fill="x")
+        tk.Button(fav_actions, text="Подробнее", command=lambda: self.on_selected(self.fav_tree, self.show_details), image=self.get_icon("details.png"), compound=tk.LEFT, font=("Arial", 10)).pack(side=tk.LEFT, padx=2, pady=2)
+        tk.Button(fav_actions, text="Убрать из избранного", command=lambda: self.on_selected(self.fav_tree, self.remove_from_favorites), image=self.get_icon("remove_fav.png"), compound=tk.LEFT, font=("Arial", 10)).pack(side=tk.LEFT, padx=2, pady=2)
+        tk.Button(fav_actions, text="Копировать IP", command=lambda: self.on_selected(self.fav_tree, self.copy_address), image=self.get_icon("copy.png"), compound=tk.LEFT, font=("Arial", 10)).pack(side=tk.LEFT, padx=2, pady=2)
+        tk.Button(fav_actions, text="Добавить тег", command=lambda: self.on_selected(self.fav_tree, self.add_tag), image=self.get_icon("tag.png"), compound=tk.LEFT, font=("Arial", 10)).pack(side=tk.LEFT, padx=2, pady=2)
+
+        self.fav_rows = {}
+        self.fav_tree = self.create_server_tree(self.fav_list_frame, self.fav_rows, [
+            ("Подробнее", self.show_details),
+            ("Убрать из избранного", self.remove_from_favorites),
+            ("Копировать IP", self.copy_address),
+            ("Добавить тег", self.add_tag),
+        ], with_tags=True)
 
         # История сканов (список)
         self.history_listbox = tk.Listbox(self.history_frame, font=("Arial", 12))
         self.history_listbox.pack(fill="both", expand=True, padx=10, pady=10)
 
+        # Постраничная навигация по истории
+        history_nav = tk.Frame(self.history_frame, bg=self.bg_color)
+        history_nav.pack(pady=5)
+        self.btn_history_prev = tk.Button(history_nav, text="← Новее", command=lambda: self.change_history_page(-1), font=("Arial", 10))
+        self.btn_history_prev.pack(side=tk.LEFT, padx=5)
+        self.history_page_label = tk.Label(history_nav, text="", font=("Arial", 10), bg=self.bg_color, fg=self.text_color)
+        self.history_page_label.pack(side=tk.LEFT, padx=5)
+        self.btn_history_next = tk.Button(history_nav, text="Старее →", command=lambda: self.change_history_page(1), font=("Arial", 10))
+        self.btn_history_next.pack(side=tk.LEFT, padx=5)
+
         # Кнопка для загрузки выбранного скана
         self.btn_load_history = tk.Button(
             self.history_frame, text="Загрузить",
@@ -231,25 +353,41 @@ class ServerScannerGUI:
         )
         self.btn_rescan_history.pack(pady=5)
 
-        # Загружаем историю
-        self.history = self.load_history()
+        # Загружаем историю (в памяти держим только текущую страницу)
+        self.history_page = 0
+        self.history_page_size = 100
+        self.history = []
+        self.store = self.load_history()
         self.show_history()
 
-        self.cards = []
-        self.results = []
+        self.index = ResultIndex()
+        self.results = self.index.results
         self.filtered_results = []
-        self.fav_cards = []
+        self.filter_job = None
+        self.scan_progress = None  # ScanProgress текущего задания
+        self.progress_job = None
+        self.rescan_job = None  # единственный таймер автопроверки
+        self.rescan_plan = RescanPlan()
+
+        # Все сканирования идут в одном фоновом цикле событий, а в Tk возвращаются через pump
+        self.service = ScanService()
+        self.pump = UiPump(self.root)
+        self.post = self.pump.post
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.default_icon = None
         self.load_default_icon()
+        self.update_tree_style()
 
         # Таймер для повторного сканирования (по умолчанию выключен)
         self.rescan_interval = 300000  # 5 минут в миллисекундах
 
     def load_default_icon(self):
+        self.default_row_icon = None
         try:
             if os.path.exists("default_icon.png"):
-                image = Image.open("default_icon.png").resize((64, 64))
-                self.default_icon = ImageTk.PhotoImage(image)
+                image = Image.open("default_icon.png")
+                self.default_icon = ImageTk.PhotoImage(image.resize((64, 64)))
+                self.default_row_icon = ImageTk.PhotoImage(image.resize(self.row_favicons.size))
             else:
                 self.default_icon = None
         except Exception as e:
@@ -257,13 +395,18 @@ class ServerScannerGUI:
             self.default_icon = None
 
     def get_icon(self, filename):
+        # Иконки кнопок загружаются один раз, а не для каждой карточки
+        if filename in self.button_icons:
+            return self.button_icons[filename]
+        icon = None
         try:
             if os.path.exists(filename):
                 image = Image.open(filename).resize((16, 16))
-                return ImageTk.PhotoImage(image)
-            return None
+                icon = ImageTk.PhotoImage(image)
         except Exception:
-            return None
+            icon = None
+        self.button_icons[filename] = icon
+        return icon
 
     def load_favorites(self):
         try:
@@ -283,38 +426,42 @@ class ServerScannerGUI:
             messagebox.showerror("Ошибка", f"Не удалось сохранить избранное: {e}")
             logging.error(f"Ошибка сохранения избранного: {e}")
 
-    def save_history(self, ip, port_range, results):
+    def save_history(self, ip, port_range, results, mode="full"):
         try:
-            entry = {
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "ip": ip,
-                "ports": port_range,
-                "servers": len(results),
-                "results": results
-            }
-            self.history.append(entry)
-            with open("history.json", "w", encoding="utf-8") as f:
-                json.dump(self.history, f, ensure_ascii=False, indent=4)
+            self.store.add_scan(ip, port_range, results, mode=mode)
         except Exception as e:
             logging.error(f"Ошибка сохранения истории: {e}")
 
     def load_history(self):
-        try:
-            with open("history.json", "r", encoding="utf-8") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return []
-        except Exception as e:
-            logging.error(f"Ошибка загрузки истории: {e}")
-            return []
+        store = ResultStore("history.db")
+        # Однократный перенос старой истории из history.json
+        if os.path.exists("history.json") and not store.count_scans():
+            try:
+                count = store.import_history_json("history.json")
+                logging.info(f"История перенесена из history.json: {count} записей")
+            except Exception as e:
+                logging.error(f"Ошибка загрузки истории: {e}")
+        return store
 
     def show_history(self):
+        total = self.store.count_scans()
+        pages = max(1, (total + self.history_page_size - 1) // self.history_page_size)
+        self.history_page = min(self.history_page, pages - 1)
+        self.history = self.store.list_scans(self.history_page * self.history_page_size, self.history_page_size)
         self.history_listbox.delete(0, tk.END)
         for entry in self.history:
+            mode = " (горячие)" if entry["mode"] == "hot" else ""
             self.history_listbox.insert(
                 tk.END,
-                f"{entry['time']} | {entry['ip']}:{entry['ports']} | {entry['servers']} серверов"
+                f"{entry['time']} | {entry['ip']}:{entry['ports']}{mode} | {entry['servers']} серверов"
             )
+        self.history_page_label.config(text=f"Страница {self.history_page + 1} из {pages}")
+        self.btn_history_prev.config(state=tk.NORMAL if self.history_page > 0 else tk.DISABLED)
+        self.btn_history_next.config(state=tk.NORMAL if self.history_page < pages - 1 else tk.DISABLED)
+
+    def change_history_page(self, delta):
+        self.history_page = max(0, self.history_page + delta)
+        self.show_history()
 
     def load_selected_history(self):
         idx = self.history_listbox.curselection()
@@ -322,9 +469,9 @@ class ServerScannerGUI:
             messagebox.showinfo("Инфо", "Выберите запись из истории")
             return
         entry = self.history[idx[0]]
-        self.results = entry["results"]
-        self.filtered_results = self.results.copy()
-        self.show_results(self.filtered_results)
+        self.reset_results()
+        self.index.extend(self.store.load_scan(entry["id"]))
+        self.render_filtered()
 
     def toggle_theme(self):
         if self.theme == "light":
@@ -347,12 +494,9 @@ class ServerScannerGUI:
         self.main_frame.config(bg=self.bg_color)
         self.fav_frame.config(bg=self.bg_color)
         self.server_list_frame.config(bg=self.bg_color)
-        self.server_canvas.config(bg=self.bg_color)
-        self.server_list.config(bg=self.bg_color)
         self.details_frame.config(bg=self.details_bg_color)
         self.fav_list_frame.config(bg=self.bg_color)
-        self.fav_canvas.config(bg=self.bg_color)
-        self.fav_list.config(bg=self.bg_color)
+        self.update_tree_style()
         for widget in self.main_frame.winfo_children():
             if isinstance(widget, (tk.Label, tk.Radiobutton, tk.Checkbutton)):
                 widget.config(bg=self.bg_color, fg=self.text_color)
@@ -369,22 +513,60 @@ class ServerScannerGUI:
             self.bg_label_fav.lower()
         self.rescan_check.config(bg=self.bg_color, fg=self.text_color)
         self.rescan_interval_entry.config(bg=self.bg_color, fg=self.text_color)
-        self.show_results(self.filtered_results)
-        self.show_favorites([r for r in self.results + self.filtered_results if (r['ip'], r['port']) in {(f['ip'], f['port']) for f in self.favorites}])
+        self.rescan_tiered_check.config(bg=self.bg_color, fg=self.text_color)
+        self.full_sweep_entry.config(bg=self.bg_color, fg=self.text_color)
+        self.fav_skip_check.config(bg=self.bg_color, fg=self.text_color)
+        self.fav_fresh_entry.config(bg=self.bg_color, fg=self.text_color)
 
     def update_scan_label(self, state):
-        if state:
-            self.scan_label.config(text=f"Сканирование ({self.progress_value:.1f}%)")
-            self.root.after(100, lambda: self.update_scan_label(state and self.btn_scan['state'] == tk.DISABLED))
-        else:
+        if not state:
             self.scan_label.config(text="")
+            return
+        if self.scan_progress is None:
+            self.scan_label.config(text="Сканирование...")
+            return
+        percent, rate, eta = self.scan_progress.sample()
+        self.progress_value = percent
+        self.progress['value'] = percent
+        text = f"Сканирование ({percent:.1f}%) · {rate:.0f} проб/с · найдено {self.scan_progress.found}"
+        if eta is not None:
+            text += f" · осталось {format_eta(eta)}"
+        self.scan_label.config(text=text)
+
+    def watch_progress(self, progress):
+        # Движок только считает завершенные проверки, а интерфейс опрашивает
+        # счетчики одним таймером с фиксированной частотой
+        self.scan_progress = progress
+        if self.progress_job is None:
+            self.progress_job = self.root.after(PROGRESS_INTERVAL, self.sample_progress)
+
+    def sample_progress(self):
+        self.progress_job = None
+        if self.scan_progress is None:
+            return
+        self.update_scan_label(True)
+        self.progress_job = self.root.after(PROGRESS_INTERVAL, self.sample_progress)
+
+    def stop_progress(self):
+        self.scan_progress = None
+        if self.progress_job is not None:
+            self.root.after_cancel(self.progress_job)
+            self.progress_job = None
+        self.update_scan_label(False)
+
+    def update_scan_stages(self):
+        # Поток сканирования читает готовый словарь, а не переменные Tk
+        self.scan_stages = {"query": self.query_var.get(), "legacy": self.legacy_var.get(),
+                            "favicon_retry": self.favicon_retry_var.get()}
+        self.scan_bedrock = self.bedrock_var.get()
 
     def toggle_rescan(self):
         if self.rescan_active.get():
             self.update_rescan_interval(None)
-            self.root.after(self.rescan_interval, self.rescan)
+            self.schedule_rescan()
             logging.info("Автопроверка включена")
         else:
+            self.cancel_rescan()
             logging.info("Автопроверка отключена")
 
     def update_rescan_interval(self, event):
@@ -399,22 +581,73 @@ class ServerScannerGUI:
             self.rescan_interval_var.set("5")
             self.rescan_interval = 300000
             logging.error("Некорректный интервал автопроверки, сброшен на 5 минут")
+        if event is not None and self.rescan_job is not None:
+            self.schedule_rescan()
+
+    def full_sweep_interval(self):
+        try:
+            return max(1.0, float(self.full_sweep_var.get())) * 60
+        except ValueError:
+            self.full_sweep_var.set("60")
+            return 3600.0
+
+    def schedule_rescan(self):
+        # Новый отсчет заменяет прежний таймер, поэтому цепочки не накапливаются
+        self.cancel_rescan()
+        if self.rescan_active.get():
+            self.rescan_job = self.root.after(self.rescan_interval, self.rescan)
 
-    async def update_progress(self, value):
-        self.progress_value = value
-        self.progress['value'] = value
-        self.root.after(0, lambda: self.update_scan_label(True))
+    def cancel_rescan(self):
+        if self.rescan_job is not None:
+            self.root.after_cancel(self.rescan_job)
+            self.rescan_job = None
+
+    def rescan(self):
+        self.rescan_job = None
+        if not self.rescan_active.get():
+            return
+        if self.service.busy():
+            # Прошлое сканирование еще идет - пропускаем срабатывание, а не ставим второе в очередь
+            logging.info("Автопроверка пропущена: предыдущее сканирование не завершено")
+        else:
+            self.rescan_plan.tiered = self.rescan_tiered.get()
+            self.rescan_plan.full_interval = self.full_sweep_interval()
+            if self.rescan_plan.due(time.monotonic()) == "full":
+                self.start_scan()
+            elif self.rescan_plan.hot:
+                self.start_hot_scan()
+            else:
+                logging.info("Автопроверка: горячих портов нет, ждем полного прохода")
+        self.schedule_rescan()
+
+    def start_hot_scan(self):
+        targets = self.rescan_plan.hot_targets()
+        self.btn_scan.config(state=tk.DISABLED)
+        self.btn_save.config(state=tk.DISABLED)
+        self.btn_stop.config(state=tk.NORMAL)
+        self.update_scan_label(True)
+        self.reset_results()
+        self.total_ports = len(targets)
+        logging.info(f"Автопроверка горячих портов: {len(targets)}")
+        self.service.submit("hot rescan", self.run_scan, self.rescan_plan.hosts, self.rescan_plan.ports,
+                            self.split_favorites(), targets)
 
     def start_scan(self):
         ip = self.entry_ip.get().strip()
         port_range = self.entry_ports.get().strip()
 
+        # В поле IP допускаются подсети, диапазоны и имена хостов через запятую,
+        # в поле портов - набор диапазонов вида 25565,36000-50000
+        try:
+            hosts = parse_hosts(ip)
+        except (ValueError, OSError) as e:
+            messagebox.showerror("Ошибка", f"Некорректный список целей: {e}")
+            logging.error(f"Некорректный список целей: {ip}")
+            return
         try:
-            start_port, end_port = map(int, port_range.split("-"))
-            if start_port < 1 or end_port > 65535 or start_port > end_port:
-                raise ValueError("Недопустимый диапазон портов")
+            ports = parse_ports(port_range)
         except ValueError:
-            messagebox.showerror("Ошибка", "Введите диапазон портов в формате 25565-25600")
+            messagebox.showerror("Ошибка", "Введите порты в формате 25565-25600 или 25565,36000-50000")
             logging.error("Недопустимый диапазон портов")
             return
 
@@ -423,27 +656,18 @@ class ServerScannerGUI:
         self.progress['value'] = 0
         self.progress_value = 0
         self.update_scan_label(True)
-        for card in self.cards:
-            card.destroy()
-        for card in self.fav_cards:
-            card.destroy()
-        self.cards.clear()
-        self.fav_cards.clear()
-        self.results.clear()
-        self.filtered_results.clear()
+        self.clear_tree(self.server_tree, self.server_rows)
+        self.clear_tree(self.fav_tree, self.fav_rows)
+        self.reset_results()
 
         self.scan_start_time = datetime.now()
-        self.total_ports = end_port - start_port + 1
-        threading.Thread(target=self.run_scan, args=(ip, start_port, end_port), daemon=True).start()
+        self.total_ports = count_hosts(hosts) * count_ports(ports)
+        self.btn_stop.config(state=tk.NORMAL)
+        self.service.submit(f"scan {ip}:{port_range}", self.run_scan, ip, port_range, self.split_favorites())
 
-        # Запуск автопроверки, если включена
-        if self.rescan_active.get():
-            self.root.after(self.rescan_interval, self.rescan)
-
-    def rescan(self):
-        if self.rescan_active.get():
-            self.start_scan()
-            self.root.after(self.rescan_interval, self.rescan)
+        # Отсчет автопроверки начинается заново от этого сканирования
+        if self.rescan_job is not None:
+            self.schedule_rescan()
 
     def rescan_selected_history(self):
         idx = self.history_listbox.curselection()
@@ -455,117 +679,193 @@ class ServerScannerGUI:
 
         ip = entry["ip"]
         port_range = entry["ports"]
-
-        if "-" in port_range:
-            start_port, end_port = port_range.split("-")
-            start_port, end_port = int(start_port), int(end_port)
-        else:
-            start_port = end_port = int(port_range)
+        try:
+            self.total_ports = count_hosts(parse_hosts(ip)) * count_ports(parse_ports(port_range))
+        except ValueError as e:
+            # Записи старых версий могли хранить в ports не только диапазон
+            messagebox.showerror("Ошибка", f"Не удалось разобрать цели записи {ip}:{port_range}: {e}")
+            return
 
         # Покажем на главной вкладке статус
         self.status_label.config(
             text=f"🔄 Пересканирование {ip}:{port_range}..."
         )
 
-        # Запускаем отдельный поток
-        t = threading.Thread(
-            target=self._run_scan_thread,
-            args=(ip, start_port, end_port),
-            daemon=True
-        )
-        t.start()
+        # Как и обычное сканирование, пересканирование заменяет текущий список результатов
+        self.btn_scan.config(state=tk.DISABLED)
+        self.btn_save.config(state=tk.DISABLED)
+        self.progress['value'] = 0
+        self.progress_value = 0
+        self.clear_tree(self.fav_tree, self.fav_rows)
+        self.reset_results()
+
+        self.scan_start_time = datetime.now()
+        self.btn_stop.config(state=tk.NORMAL)
+        self.service.submit(f"rescan {ip}:{port_range}", self.run_history_rescan, ip, port_range, self.split_favorites())
 
-    def _run_scan_thread(self, ip, start_port, end_port):
+    async def run_history_rescan(self, ip, port_range, favorites):
         try:
-            self.run_scan(ip, start_port, end_port)
-            self.status_label.config(
-                text=f"✅ Пересканирование завершено ({ip}:{start_port}-{end_port})"
-            )
+            await self.run_scan(ip, port_range, favorites)
+            self.post(lambda: self.status_label.config(text=f"✅ Пересканирование завершено ({ip}:{port_range})"))
         except Exception as e:
-            self.status_label.config(text=f"❌ Ошибка пересканирования: {e}")
-
-
-    def run_scan(self, ip, start_port, end_port):
+            self.post(lambda e=e: self.status_label.config(text=f"❌ Ошибка пересканирования: {e}"))
+
+    def stop_scan(self):
+        self.service.cancel_all()
+        logging.info("Сканирование остановлено пользователем")
+
+    def on_close(self):
+        self.service.stop()
+        self.pump.stop()
+        self.store.close()
+        self.root.destroy()
+
+    async def run_scan(self, ip, port_range, favorites, hot=None):
+        # Выполняется в цикле ScanService; интерфейс обновляется только через self.post.
+        # hot - список (ip, port) для перепроверки вместо всего диапазона
+        main_results = []
         try:
             start_time = datetime.now()
-            # Сканируем избранные сервера
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            fav_results = []
-            for i, fav in enumerate(self.favorites):
-                result = loop.run_until_complete(scan_ports(
-                    fav["ip"], fav["port"], fav["port"], timeout=2.0, concurrency=1,
-                    progress_callback=self.update_progress
-                ))
-                if result:
-                    fav_results.extend([r for r in result if isinstance(r, dict)])
-                self.progress_value = (i + 1) / len(self.favorites) * 100 if self.favorites else 0
-                self.progress['value'] = self.progress_value
-                self.root.after(0, lambda: self.update_scan_label(True))
-
-            # Сканируем основной диапазон
-            main_results = loop.run_until_complete(scan_ports(
-                ip, start_port, end_port, timeout=2.0, concurrency=50,
-                progress_callback=self.update_progress
-            ))
-            self.results = [r for r in main_results if isinstance(r, dict)]
-            self.filtered_results = self.results.copy()
-            self.progress_value = 100
-            self.progress['value'] = 100
-            self.root.after(0, lambda: self.show_results(self.filtered_results))
-            self.root.after(0, lambda: self.show_favorites(fav_results))
-            self.root.after(0, lambda: self.btn_scan.config(state=tk.NORMAL))
-            self.root.after(0, lambda: self.btn_save.config(state=tk.NORMAL))
-            self.root.after(0, lambda: self.update_scan_label(False))
+            # Избранные сервера проверяются одним пакетом перед основным диапазоном
+            await self.check_favorites_async(*favorites)
+
+            # Сканируем основной диапазон, строки добавляются по мере ответа серверов
+            stats = ScanStats()
+            targets = iter_targets(parse_hosts(ip), parse_ports(port_range)) if hot is None else hot
+            progress = ScanProgress(self.total_ports)
+            self.post(self.watch_progress, progress)
+            if self.scan_bedrock:
+                servers = iter_bedrock_scan(targets, timeout=1.0, stats=stats, progress=progress)
+            else:
+                servers = iter_scan(targets, timeout=2.0, concurrency=50, stats=stats, progress=progress,
+                                    **self.scan_stages)
+            async for result in servers:
+                main_results.append(result)
+                self.post(self.add_result, result)
+
             scan_time = (datetime.now() - start_time).total_seconds()
-            self.stats_label.config(text=f"Статистика: {len(self.results)} серверов, {self.total_ports} портов, {scan_time:.1f} сек")
-            logging.info(f"Сканирование завершено: {len(self.results)} серверов, {self.total_ports} портов, {scan_time:.1f} сек")
-            loop.close()
-            self.save_history(ip, f"{start_port}-{end_port}", self.results)
-            self.show_history()
+            self.post(self.finish_scan, f"Статистика: {len(main_results)} серверов, {self.total_ports} портов, {scan_time:.1f} сек")
+            logging.info(f"Сканирование завершено: {len(main_results)} серверов, {self.total_ports} портов, {scan_time:.1f} сек")
+            if stats.favicon_fallbacks:
+                logging.info(f"Повторных запросов favicon: {stats.favicon_fallbacks}, получено иконок: {stats.favicon_recovered}")
+            if stats.failures:
+                logging.info(f"Неудачные попытки: {stats.failure_summary()}; повторы: {stats.retries}")
+            found = [(r['ip'], r['port']) for r in main_results]
+            if hot is None:
+                self.post(self.rescan_plan.record_full, time.monotonic(), found, ip, port_range)
+            else:
+                self.post(self.rescan_plan.record_hot, hot, found)
+            await asyncio.to_thread(self.save_history, ip, port_range, main_results, "full" if hot is None else "hot")
+            self.post(self.show_history)
+        except asyncio.CancelledError:
+            logging.info(f"Сканирование {ip}:{port_range} остановлено, найдено {len(main_results)} серверов")
+            self.post(self.scan_stopped, bool(main_results))
+            raise
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Ошибка", f"Произошла ошибка при сканировании: {e}"))
-            self.root.after(0, lambda: self.btn_scan.config(state=tk.NORMAL))
-            self.root.after(0, lambda: self.progress['value'] == 0)
-            self.root.after(0, lambda: self.update_scan_label(False))
+            self.post(messagebox.showerror, "Ошибка", f"Произошла ошибка при сканировании: {e}")
+            self.post(self.scan_stopped, bool(main_results))
             logging.error(f"Ошибка при сканировании: {e}")
 
+    def finish_scan(self, stats_text):
+        self.progress_value = 100
+        self.progress['value'] = 100
+        self.finish_results()
+        self.btn_scan.config(state=tk.NORMAL)
+        self.btn_save.config(state=tk.NORMAL)
+        self.btn_stop.config(state=tk.DISABLED)
+        self.stop_progress()
+        self.stats_label.config(text=stats_text)
+
+    def scan_stopped(self, has_results=False):
+        self.progress_value = 0
+        self.progress['value'] = 0
+        self.btn_scan.config(state=tk.NORMAL)
+        self.btn_check_favs.config(state=tk.NORMAL)
+        self.btn_stop.config(state=tk.DISABLED)
+        if has_results:
+            self.btn_save.config(state=tk.NORMAL)
+        self.stop_progress()
+
     def check_favorites(self):
         if not self.favorites:
             messagebox.showinfo("Информация", "Нет избранных серверов")
             return
         self.btn_check_favs.config(state=tk.DISABLED)
-        threading.Thread(target=self.run_fav_check, daemon=True).start()
+        self.btn_stop.config(state=tk.NORMAL)
+        self.service.submit("favorites", self.run_fav_check, self.split_favorites())
 
-    def run_fav_check(self):
+    async def run_fav_check(self, favorites):
         try:
             start_time = datetime.now()
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            fav_results = []
-            for i, fav in enumerate(self.favorites):
-                result = loop.run_until_complete(scan_ports(
-                    fav["ip"], fav["port"], fav["port"], timeout=2.0, concurrency=1,
-                    progress_callback=self.update_progress
-                ))
-                if result:
-                    fav_results.extend([r for r in result if isinstance(r, dict)])
-                self.progress_value = (i + 1) / len(self.favorites) * 100
-                self.progress['value'] = self.progress_value
-                self.root.after(0, lambda: self.update_scan_label(True))
-            self.root.after(0, lambda: self.show_favorites(fav_results))
-            self.root.after(0, lambda: self.btn_check_favs.config(state=tk.NORMAL))
-            self.root.after(0, lambda: self.update_scan_label(False))
+            fav_results = await self.check_favorites_async(*favorites)
             scan_time = (datetime.now() - start_time).total_seconds()
-            self.stats_label.config(text=f"Статистика: {len(fav_results)} избранных серверов, {scan_time:.1f} сек")
+            self.post(self.finish_fav_check, f"Статистика: {len(fav_results)} избранных серверов, {scan_time:.1f} сек")
             logging.info(f"Проверка избранного завершена: {len(fav_results)} серверов, {scan_time:.1f} сек")
-            loop.close()
+        except asyncio.CancelledError:
+            self.post(self.scan_stopped)
+            raise
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Ошибка", f"Ошибка при проверке избранного: {e}"))
-            self.root.after(0, lambda: self.btn_check_favs.config(state=tk.NORMAL))
-            self.root.after(0, lambda: self.update_scan_label(False))
+            self.post(messagebox.showerror, "Ошибка", f"Ошибка при проверке избранного: {e}")
+            self.post(self.scan_stopped)
             logging.error(f"Ошибка при проверке избранного: {e}")
 
+    def finish_fav_check(self, stats_text):
+        self.btn_check_favs.config(state=tk.NORMAL)
+        self.btn_stop.config(state=tk.DISABLED)
+        self.stop_progress()
+        self.stats_label.config(text=stats_text)
+
+    def fav_fresh_age(self):
+        # Сколько секунд ответ избранного считается свежим; None - проверять все
+        if not self.fav_skip_fresh.get():
+            return None
+        try:
+            return max(0.0, float(self.fav_fresh_var.get())) * 60
+        except ValueError:
+            return None
+
+    def split_favorites(self):
+        # Избранные, для которых есть недавний успешный ответ, не опрашиваем: показываем этот ответ
+        max_age = self.fav_fresh_age()
+        now = datetime.now()
+        targets, fresh = [], []
+        for fav in self.favorites:
+            last = self.fav_last_results.get((fav['ip'], fav['port']))
+            if max_age and last and fav.get("last_ok"):
+                age = (now - datetime.strptime(fav["last_ok"], "%Y-%m-%d %H:%M:%S")).total_seconds()
+                if age < max_age:
+                    fresh.append(last)
+                    continue
+            targets.append((fav['ip'], fav['port']))
+        return targets, fresh
+
+    async def check_favorites_async(self, targets, fav_results):
+        # Все избранные опрашиваются одним заданием через общий движок сканирования,
+        # строки появляются в списке избранного по мере ответов
+        fav_results = list(fav_results)
+        self.post(self.clear_tree, self.fav_tree, self.fav_rows)
+        for result in fav_results:
+            self.post(self.insert_server_row, self.fav_tree, self.fav_rows, result)
+        if targets:
+            logging.info(f"Проверка избранного: {len(targets)} серверов, пропущено свежих: {len(fav_results)}")
+            progress = ScanProgress(len(targets))
+            self.post(self.watch_progress, progress)
+            async for result in iter_scan(targets, timeout=2.0, concurrency=50, progress=progress, **self.scan_stages):
+                fav_results.append(result)
+                self.post(self.add_favorite_result, result)
+            self.post(self.save_favorites)
+        return fav_results
+
+    def add_favorite_result(self, result):
+        key = (result['ip'], result['port'])
+        fav = next((f for f in self.favorites if (f['ip'], f['port']) == key), None)
+        if fav is None:
+            # Убран из избранного, пока шла проверка
+            return
+        fav["last_ok"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.fav_last_results[key] = result
+        self.insert_server_row(self.fav_tree, self.fav_rows, result)
+
     def import_servers(self):
         try:
             import tkinter.filedialog as filedialog
@@ -584,174 +884,183 @@ class ServerScannerGUI:
                     logging.warning(f"Неверный формат импорта: {server}")
             self.favorites = list({(f['ip'], f['port']): f for f in self.favorites}.values())
             self.save_favorites()
-            self.show_favorites([r for r in self.results if (r['ip'], r['port']) in {(f['ip'], f['port']) for f in self.favorites}])
+            self.refresh_favorites()
             messagebox.showinfo("Успех", f"Импортировано {len(servers)} серверов")
             logging.info(f"Импортировано {len(servers)} серверов из {file_path}")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при импорте: {e}")
             logging.error(f"Ошибка при импорте: {e}")
 
+    def current_filter(self):
+        return make_filter(self.filter_var.get() == "players", self.core_var.get(), self.version_var.get(), self.motd_var.get())
+
+    def current_order(self):
+        return {"По пингу": "ping", "По игрокам": "players"}.get(self.sort_var.get())
+
+    def reset_results(self):
+        self.cancel_render()
+        self.clear_tree(self.server_tree, self.server_rows)
+        self.index.clear()
+        self.filtered_results = []
+
     def apply_filter(self, event=None):
-        self.filtered_results = self.results.copy()
-        # Фильтр по игрокам
-        if self.filter_var.get() == "players":
-            self.filtered_results = [r for r in self.filtered_results if r['players_online'] > 0]
-        # Фильтр по ядру
-        if self.core_var.get() != "all":
-            self.filtered_results = [r for r in self.filtered_results if r['core'].lower() == self.core_var.get().lower()]
-        # Фильтр по версии
-        if self.version_var.get():
-            self.filtered_results = [r for r in self.filtered_results if self.version_var.get().lower() in r['version'].lower()]
-        # Фильтр по MOTD
-        if self.motd_var.get():
-            self.filtered_results = [r for r in self.filtered_results if self.motd_var.get().lower() in r['motd'].lower()]
-        self.show_results(self.filtered_results)
-        self.apply_sort(None)
+        # Ввод в поля фильтра не перерисовывает список на каждую клавишу:
+        # перерисовка одна, после паузы в вводе
+        self.cancel_render()
+        self.filter_job = self.root.after(150, self.render_filtered)
 
     def apply_sort(self, _):
-        sort_key = self.sort_var.get()
-        if sort_key == "По пингу":
-            self.filtered_results.sort(key=lambda x: x['ping'])
-        elif sort_key == "По игрокам":
-            self.filtered_results.sort(key=lambda x: x['players_online'], reverse=True)
+        self.apply_filter()
+
+    def cancel_render(self):
+        if self.filter_job:
+            self.root.after_cancel(self.filter_job)
+            self.filter_job = None
+
+    def render_filtered(self):
+        self.filter_job = None
+        self.filtered_results = self.index.query(self.current_filter(), self.current_order())
         self.show_results(self.filtered_results)
 
+    def add_result(self, result):
+        # Результат, пришедший во время сканирования: сразу добавляем строку
+        if not isinstance(result, ServerStatus):
+            logging.warning(f"Invalid result skipped: {result}")
+            return
+        i = self.index.add(result)
+        if self.index.matches(i, self.current_filter()):
+            self.filtered_results.append(result)
+            self.insert_server_row(self.server_tree, self.server_rows, result)
+
+    def finish_results(self):
+        if not self.results:
+            messagebox.showinfo("Результат", "Сервера не найдены")
+            logging.info("Сервера не найдены")
+        elif self.current_order():
+            # Во время сканирования строки шли в порядке ответа
+            self.render_filtered()
+
     def copy_to_clipboard(self, text):
         self.root.clipboard_clear()
         self.root.clipboard_append(text)
         messagebox.showinfo("Успех", f"Скопировано в буфер обмена: {text}")
         logging.info(f"Скопировано в буфер: {text}")
 
-    def show_results(self, results):
-        for card in self.cards:
-            card.destroy()
-        self.cards.clear()
+    def copy_address(self, result):
+        self.copy_to_clipboard(f"{result['ip']}:{result['port']}")
+
+    def create_server_tree(self, parent, rows, actions, with_tags=False):
+        columns = ["motd", "version", "players", "core", "ping"] + (["tags"] if with_tags else [])
+        headings = {"motd": "MOTD", "version": "Версия", "players": "Игроки", "core": "Core", "ping": "Ping", "tags": "Теги"}
+        widths = {"motd": 220, "version": 110, "players": 70, "core": 70, "ping": 70, "tags": 120}
+        tree = ttk.Treeview(parent, columns=columns, style="Servers.Treeview", selectmode="browse")
+        tree.heading("#0", text="IP:Port")
+        tree.column("#0", width=170, stretch=False)
+        for column in columns:
+            tree.heading(column, text=headings[column])
+            tree.column(column, width=widths[column], stretch=column == "motd")
+        scrollbar = ttk.Scrollbar(parent, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        tree.pack(side="left", fill="both", expand=True)
+
+        tree.bind("<Double-1>", lambda e: self.on_selected(tree, self.show_details))
+        tree.bind("<Return>", lambda e: self.on_selected(tree, self.show_details))
+        menu = tk.Menu(tree, tearoff=0)
+        for label, command in actions:
+            menu.add_command(label=label, command=lambda c=command: self.on_selected(tree, c))
+
+        def popup(event):
+            row = tree.identify_row(event.y)
+            if row:
+                tree.selection_set(row)
+                menu.tk_popup(event.x_root, event.y_root)
+        tree.bind("<Button-3>", popup)
+        tree.rows = rows
+        return tree
+
+    def update_tree_style(self):
+        self.tree_style.configure("Servers.Treeview", rowheight=28, background=self.card_bg_color,
+                                  fieldbackground=self.bg_color, foreground=self.text_color)
+        online_bg = "#d8f5d8" if self.theme == "light" else "#35503a"
+        for tree in (self.server_tree, self.fav_tree):
+            tree.tag_configure("online", background=online_bg)
+            tree.tag_configure("offline", background=self.card_bg_color)
+
+    def on_selected(self, tree, action):
+        selection = tree.selection()
+        if not selection:
+            messagebox.showinfo("Инфо", "Выберите сервер в списке")
+            return
+        action(tree.rows[selection[0]])
+
+    def clear_tree(self, tree, rows):
+        # Отменяем недорисованную порцию прошлого рендера
+        job = self.render_jobs.pop(str(tree), None)
+        if job:
+            self.root.after_cancel(job)
+        tree.delete(*tree.get_children())
+        rows.clear()
+
+    def insert_server_row(self, tree, rows, r):
+        if not isinstance(r, ServerStatus):
+            logging.warning(f"Invalid result skipped: {r}")
+            return
+        values = [strip_color_codes(r['motd']).replace("\n", " "), r['version'],
+                  f"{r['players_online']}/{r['players_max']}", r['core'], f"{r['ping']:.0f} ms"]
+        if tree is self.fav_tree:
+            fav = next((f for f in self.favorites if f['ip'] == r['ip'] and f['port'] == r['port']), None)
+            values.append(", ".join(fav['tags']) if fav and fav.get("tags") else "")
+        icon = self.row_favicons.get(r.favicon_hash) or self.default_row_icon
+        iid = tree.insert("", "end", text=f"{r['ip']}:{r['port']}", image=icon or "", values=values,
+                          tags=("online" if r['players_online'] > 0 else "offline",))
+        rows[iid] = r
+
+    def fill_tree(self, tree, rows, results, chunk=500):
+        # Строки вставляются порциями между событиями Tk: первая порция видна сразу,
+        # а список из 10 000 серверов не блокирует интерфейс
+        self.clear_tree(tree, rows)
+        results = iter(results)
+
+        def insert_chunk():
+            self.render_jobs.pop(str(tree), None)
+            for _ in range(chunk):
+                r = next(results, None)
+                if r is None:
+                    return
+                self.insert_server_row(tree, rows, r)
+            self.render_jobs[str(tree)] = self.root.after(1, insert_chunk)
+
+        insert_chunk()
 
+    def show_results(self, results):
         if not results:
+            self.clear_tree(self.server_tree, self.server_rows)
             messagebox.showinfo("Результат", "Сервера не найдены")
             logging.info("Сервера не найдены")
             return
-
-        for r in results:
-            if not isinstance(r, dict):
-                logging.warning(f"Invalid result skipped: {r}")
-                continue
-
-            frame = tk.Frame(self.server_list, bd=2, relief="groove", padx=15, pady=10, bg=self.card_bg_color)
-            frame.pack(fill="x", padx=10, pady=5)
-            frame.bind("<Enter>", lambda e, f=frame: f.config(bg="#d0d0d0" if self.theme == "light" else "#5a5a5a"))
-            frame.bind("<Leave>", lambda e, f=frame: f.config(bg=self.card_bg_color))
-            self.cards.append(frame)
-
-            # Индикатор онлайна
-            online_color = "#00ff00" if r['players_online'] > 0 else "#ff0000"
-            tk.Frame(frame, bg=online_color, width=5).pack(side="left", fill="y")
-
-            # Фавикон
-            has_favicon = bool(r.get("favicon") and isinstance(r["favicon"], str) and r["favicon"].startswith("data:image/"))
-            if has_favicon:
-                try:
-                    img_data = base64.b64decode(r["favicon"].split(",")[1])
-                    image = Image.open(BytesIO(img_data)).convert("RGBA").resize((64, 64))
-                    background = Image.new("RGBA", image.size, (255, 255, 255, 255))
-                    composite = Image.alpha_composite(background, image)
-                    icon = ImageTk.PhotoImage(composite)
-                    label_icon = tk.Label(frame, image=icon, bg=self.card_bg_color)
-                    label_icon.image = icon
-                    label_icon.pack(side="left", padx=5)
-                    logging.info(f"Favicon отображен для {r['ip']}:{r['port']}")
-                except Exception as e:
-                    has_favicon = False
-                    logging.error(f"Ошибка favicon для {r['ip']}:{r['port']}: {e}")
-                    if self.default_icon:
-                        tk.Label(frame, image=self.default_icon, bg=self.card_bg_color).pack(side="left", padx=5)
-                    else:
-                        tk.Label(frame, text="🖼", font=("Arial", 20), bg=self.card_bg_color).pack(side="left", padx=5)
-            else:
-                logging.info(f"Нет favicon для {r['ip']}:{r['port']}")
-                if self.default_icon:
-                    tk.Label(frame, image=self.default_icon, bg=self.card_bg_color).pack(side="left", padx=5)
-                else:
-                    tk.Label(frame, text="🖼", font=("Arial", 20), bg=self.card_bg_color).pack(side="left", padx=5)
-
-            # Базовая информация на карточке
-            tk.Label(frame, text=f"{r['ip']}:{r['port']}", font=("Arial", 12, "bold"), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            self.render_motd_colored(r['motd'], frame)
-            tk.Label(frame, text=f"Версия: {r['version']}", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            tk.Label(frame, text=f"Игроки: {r['players_online']}/{r['players_max']}", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            tk.Label(frame, text=f"Forge: {'✔' if r['forge'] else '✘'}", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            tk.Label(frame, text=f"Core: {r['core']}", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            tk.Label(frame, text=f"Ping: {r['ping']} ms", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            tk.Button(frame, text="Подробнее", command=lambda res=r: self.show_details(res), image=self.get_icon("details.png"), compound=tk.LEFT, font=("Arial", 10)).pack(anchor="w")
-            tk.Button(frame, text="В избранное", command=lambda res=r: self.add_to_favorites(res), image=self.get_icon("favorite.png"), compound=tk.LEFT, font=("Arial", 10)).pack(anchor="w")
-            tk.Button(frame, text="Копировать IP", command=lambda res=r: self.copy_to_clipboard(f"{res['ip']}:{res['port']}"), image=self.get_icon("copy.png"), compound=tk.LEFT, font=("Arial", 10)).pack(anchor="w")
-
-        self.server_canvas.configure(scrollregion=self.server_canvas.bbox("all"))
+        self.fill_tree(self.server_tree, self.server_rows, list(results))
 
     def show_favorites(self, fav_results):
-        for card in self.fav_cards:
-            card.destroy()
-        self.fav_cards.clear()
-
-        for r in fav_results:
-            if not isinstance(r, dict):
-                logging.warning(f"Invalid favorite result skipped: {r}")
-                continue
-
-            frame = tk.Frame(self.fav_list, bd=2, relief="groove", padx=15, pady=10, bg=self.card_bg_color)
-            frame.pack(fill="x", padx=10, pady=5)
-            frame.bind("<Enter>", lambda e, f=frame: f.config(bg="#d0d0d0" if self.theme == "light" else "#5a5a5a"))
-            frame.bind("<Leave>", lambda e, f=frame: f.config(bg=self.card_bg_color))
-            self.fav_cards.append(frame)
-
-            # Индикатор онлайна
-            online_color = "#00ff00" if r['players_online'] > 0 else "#ff0000"
-            tk.Frame(frame, bg=online_color, width=5).pack(side="left", fill="y")
-
-            # Фавикон
-            has_favicon = bool(r.get("favicon") and isinstance(r["favicon"], str) and r["favicon"].startswith("data:image/"))
-            if has_favicon:
-                try:
-                    img_data = base64.b64decode(r["favicon"].split(",")[1])
-                    image = Image.open(BytesIO(img_data)).convert("RGBA").resize((64, 64))
-                    background = Image.new("RGBA", image.size, (255, 255, 255, 255))
-                    composite = Image.alpha_composite(background, image)
-                    icon = ImageTk.PhotoImage(composite)
-                    label_icon = tk.Label(frame, image=icon, bg=self.card_bg_color)
-                    label_icon.image = icon
-                    label_icon.pack(side="left", padx=5)
-                    logging.info(f"Favicon отображен для {r['ip']}:{r['port']} (избранное)")
-                except Exception as e:
-                    has_favicon = False
-                    logging.error(f"Ошибка favicon для {r['ip']}:{r['port']} (избранное): {e}")
-                    if self.default_icon:
-                        tk.Label(frame, image=self.default_icon, bg=self.card_bg_color).pack(side="left", padx=5)
-                    else:
-                        tk.Label(frame, text="🖼", font=("Arial", 20), bg=self.card_bg_color).pack(side="left", padx=5)
-            else:
-                logging.info(f"Нет favicon для {r['ip']}:{r['port']} (избранное)")
-                if self.default_icon:
-                    tk.Label(frame, image=self.default_icon, bg=self.card_bg_color).pack(side="left", padx=5)
-                else:
-                    tk.Label(frame, text="🖼", font=("Arial", 20), bg=self.card_bg_color).pack(side="left", padx=5)
-
-            # Базовая информация на карточке избранного
-            tk.Label(frame, text=f"{r['ip']}:{r['port']}", font=("Arial", 12, "bold"), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            self.render_motd_colored(r['motd'], frame)
-            tk.Label(frame, text=f"Версия: {r['version']}", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            tk.Label(frame, text=f"Игроки: {r['players_online']}/{r['players_max']}", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            tk.Label(frame, text=f"Forge: {'✔' if r['forge'] else '✘'}", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            tk.Label(frame, text=f"Core: {r['core']}", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            tk.Label(frame, text=f"Ping: {r['ping']} ms", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            fav = next((f for f in self.favorites if f['ip'] == r['ip'] and f['port'] == r['port']), None)
-            if fav and fav.get("tags"):
-                tk.Label(frame, text=f"Теги: {', '.join(fav['tags'])}", font=("Arial", 10), bg=self.card_bg_color, fg=self.text_color).pack(anchor="w")
-            tk.Button(frame, text="Подробнее", command=lambda res=r: self.show_details(res), image=self.get_icon("details.png"), compound=tk.LEFT, font=("Arial", 10)).pack(anchor="w")
-            tk.Button(frame, text="Убрать из избранного", command=lambda res=r: self.remove_from_favorites(res), image=self.get_icon("remove_fav.png"), compound=tk.LEFT, font=("Arial", 10)).pack(anchor="w")
-            tk.Button(frame, text="Копировать IP", command=lambda res=r: self.copy_to_clipboard(f"{res['ip']}:{res['port']}"), image=self.get_icon("copy.png"), compound=tk.LEFT, font=("Arial", 10)).pack(anchor="w")
-            tk.Button(frame, text="Добавить тег", command=lambda res=r: self.add_tag(res), image=self.get_icon("tag.png"), compound=tk.LEFT, font=("Arial", 10)).pack(anchor="w")
-
-        self.fav_canvas.configure(scrollregion=self.fav_canvas.bbox("all"))
+        self.fill_tree(self.fav_tree, self.fav_rows, list(fav_results))
+
+    def refresh_favorites(self, *extra):
+        # Для каждого избранного - самый свежий известный ответ: из проверки избранного или из скана
+        keys = {(f['ip'], f['port']) for f in self.favorites}
+        latest = {}
+        for r in [*self.fav_last_results.values(), *self.results, *extra]:
+            if (r['ip'], r['port']) in keys:
+                latest[(r['ip'], r['port'])] = r
+        self.show_favorites(latest.values())
+
+    def add_favicon_label(self, frame, r):
+        icon = self.favicon_cache.get(r.favicon_hash)
+        if icon:
+            tk.Label(frame, image=icon, bg=self.details_bg_color).pack(side="left", padx=5)
+        elif self.default_icon:
+            tk.Label(frame, image=self.default_icon, bg=self.details_bg_color).pack(side="left", padx=5)
+        else:
+            tk.Label(frame, text="🖼", font=("Arial", 20), bg=self.details_bg_color).pack(side="left", padx=5)
 
     def render_motd_colored(self, motd, parent):
         text_widget = Text(parent, height=2, wrap="word", bg=self.card_bg_color, borderwidth=0, highlightthickness=0, fg=self.text_color, font=("Arial", 10))
@@ -785,7 +1094,10 @@ class ServerScannerGUI:
         frame = tk.Frame(self.details_frame, padx=10, pady=10, bg=self.details_bg_color)
         frame.pack(fill="both", expand=True)
 
-        tk.Label(frame, text=f"Сервер: {result['ip']}:{result['port']}", font=("Arial", 14, "bold"), bg=self.details_bg_color, fg=self.text_color).pack(anchor="w")
+        header = tk.Frame(frame, bg=self.details_bg_color)
+        header.pack(anchor="w", fill="x")
+        self.add_favicon_label(header, result)
+        tk.Label(header, text=f"Сервер: {result['ip']}:{result['port']}", font=("Arial", 14, "bold"), bg=self.details_bg_color, fg=self.text_color).pack(side="left")
         tk.Button(frame, text="Копировать IP", command=lambda: self.copy_to_clipboard(f"{result['ip']}:{result['port']}"), image=self.get_icon("copy.png"), compound=tk.LEFT, font=("Arial", 10)).pack(anchor="w")
         self.render_motd_colored(result['motd'], frame)
         tk.Label(frame, text=f"Версия: {result['version']} (протокол {result['protocol']})", font=("Arial", 10), bg=self.details_bg_color, fg=self.text_color).pack(anchor="w")
@@ -798,6 +1110,8 @@ class ServerScannerGUI:
         tk.Label(frame, text=f"Forge: {'✔' if result['forge'] else '✘'}", font=("Arial", 10), bg=self.details_bg_color, fg=self.text_color).pack(anchor="w")
         tk.Label(frame, text=f"Core: {result['core']}", font=("Arial", 10), bg=self.details_bg_color, fg=self.text_color).pack(anchor="w")
         tk.Label(frame, text=f"Ping: {result['ping']} ms", font=("Arial", 10), bg=self.details_bg_color, fg=self.text_color).pack(anchor="w")
+        if result.get("map"):
+            tk.Label(frame, text=f"Карта: {result['map']}", font=("Arial", 10), bg=self.details_bg_color, fg=self.text_color).pack(anchor="w")
         favicon_status = "✔" if result.get("favicon") and isinstance(result["favicon"], str) and result["favicon"].startswith("data:image/") else "✘ (отсутствует или поврежден)"
         tk.Label(frame, text=f"Favicon: {favicon_status}", font=("Arial", 10), bg=self.details_bg_color, fg=self.text_color).pack(anchor="w")
         # Теги
@@ -846,14 +1160,14 @@ class ServerScannerGUI:
         if fav_key not in {(f['ip'], f['port']) for f in self.favorites}:
             self.favorites.append({"ip": result['ip'], "port": result['port'], "tags": []})
             self.save_favorites()
-            self.show_favorites([r for r in self.results + [result] if (r['ip'], r['port']) in {(f['ip'], f['port']) for f in self.favorites}])
+            self.refresh_favorites(result)
             messagebox.showinfo("Успех", f"Сервер {result['ip']}:{result['port']} добавлен в избранное")
             logging.info(f"Добавлен в избранное: {result['ip']}:{result['port']}")
 
     def remove_from_favorites(self, result):
         self.favorites = [f for f in self.favorites if not (f['ip'] == result['ip'] and f['port'] == result['port'])]
         self.save_favorites()
-        self.show_favorites([r for r in self.results + [result] if (r['ip'], r['port']) in {(f['ip'], f['port']) for f in self.favorites}])
+        self.refresh_favorites(result)
         messagebox.showinfo("Успех", f"Сервер {result['ip']}:{result['port']} удален из избранного")
         logging.info(f"Удален из избранного: {result['ip']}:{result['port']}")
 
@@ -864,7 +1178,7 @@ class ServerScannerGUI:
                 if fav['ip'] == result['ip'] and fav['port'] == result['port']:
                     fav['tags'].append(tag)
             self.save_favorites()
-            self.show_favorites([r for r in self.results + [result] if (r['ip'], r['port']) in {(f['ip'], f['port']) for f in self.favorites}])
+            self.refresh_favorites(result)
             messagebox.showinfo("Успех", f"Тег '{tag}' добавлен")
             logging.info(f"Добавлен тег '{tag}' для {result['ip']}:{result['port']}")
 
@@ -874,22 +1188,47 @@ class ServerScannerGUI:
             logging.info("Попытка сохранить пустые результаты")
             return
 
-        filename = f"scan_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        filename = f"scan_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson.gz"
         try:
-            data = {
-                "scanned_at": datetime.utcnow().isoformat(),
-                "servers_found": len(self.results),
-                "results": self.results
-            }
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
+            with ResultWriter(filename, fsync_every=0) as writer:
+                for r in self.results:
+                    writer.write(r)
             messagebox.showinfo("Успех", f"Результаты сохранены в {filename}")
             logging.info(f"Результаты сохранены в {filename}")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось сохранить результаты: {e}")
             logging.error(f"Ошибка сохранения результатов: {e}")
 
+    def open_results(self):
+        import tkinter.filedialog as filedialog
+        file_path = filedialog.askopenfilename(filetypes=[
+            ("Результаты", "*.ndjson *.jsonl *.gz *.zst *.json"), ("Все файлы", "*.*")
+        ])
+        if not file_path:
+            return
+        self.reset_results()
+        self.load_results_chunk(iter_results_file(file_path), file_path)
+
+    def load_results_chunk(self, results, file_path, chunk=200):
+        # Файл читается порциями между событиями Tk, интерфейс не замирает
+        try:
+            for _ in range(chunk):
+                self.add_result(next(results))
+        except StopIteration:
+            self.finish_results()
+            self.btn_save.config(state=tk.NORMAL)
+            logging.info(f"Загружено {len(self.results)} серверов из {file_path}")
+            return
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось загрузить результаты: {e}")
+            logging.error(f"Ошибка загрузки результатов из {file_path}: {e}")
+            return
+        self.root.after(1, lambda: self.load_results_chunk(results, file_path, chunk))
+
 if __name__ == "__main__":
+    setup_logging("scanner.log")
+    # Иконки хранятся один раз, декодированными PNG рядом с миниатюрами
+    set_favicon_store(FaviconStore("favicon_cache"))
     root = tk.Tk()
     app = ServerScannerGUI(root)
     root.mainloop()
@@ -0,0 +1,126 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# Логирование без записи на диск из цикла событий: записи кладутся в очередь,
+# файл пишет отдельный поток (QueueListener). Модули сканера только вызывают
+# logging.*, а настраивает логирование точка входа (gui.py, scanner.py, daemon.py)
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Сколько записей в секунду пропускать для каждого уровня; ERROR и выше проходят всегда
+DEFAULT_RATES = {logging.DEBUG: 100, logging.INFO: 200, logging.WARNING: 50}
+
+class LogSampler(logging.Filter):
+    # Стоит на QueueHandler, до постановки в очередь:
+    # - записи с extra={"aggregate": "ключ"} не пишутся по одной, а считаются
+    #   и выводятся сводкой "13842 × status probes failed";
+    # - остальные ограничиваются по частоте на каждый уровень, число
+    #   подавленных записей тоже попадает в сводку.
+    # Сводка пишется перед следующей обычной записью уровня INFO и выше
+    # (порядок в логе сохраняется) или раз в interval секунд
+    def __init__(self, handler, rates=None, interval=10.0):
+        super().__init__()
+        self.handler = handler
+        self.rates = DEFAULT_RATES if rates is None else rates
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counts = {}  # (уровень, ключ) -> количество
+        self.dropped = {}  # уровень -> подавлено записей
+        self.window_start = time.monotonic()
+        self.window_counts = {}
+        self.last_flush = self.window_start
+
+    def filter(self, record):
+        key = getattr(record, "aggregate", None)
+        with self.lock:
+            now = time.monotonic()
+            if key is not None:
+                counter = (record.levelno, key)
+                self.counts[counter] = self.counts.get(counter, 0) + 1
+                passed = False
+            else:
+                passed = self._allow(record.levelno, now)
+            due = now - self.last_flush >= self.interval or (passed and record.levelno >= logging.INFO)
+            summary = self._take(now) if due else []
+        for item in summary:
+            self.handler.enqueue(self.handler.prepare(item))
+        return passed
+
+    def _allow(self, level, now):
+        limit = self.rates.get(level)
+        if limit is None or level >= logging.ERROR:
+            return True
+        if now - self.window_start >= 1.0:
+            self.window_start = now
+            self.window_counts.clear()
+        count = self.window_counts.get(level, 0)
+        if count >= limit:
+            self.dropped[level] = self.dropped.get(level, 0) + 1
+            return False
+        self.window_counts[level] = count + 1
+        return True
+
+    def _take(self, now):
+        records = [self._record(level, f"{count} × {key}") for (level, key), count in self.counts.items()]
+        records += [
+            self._record(logging.WARNING, f"Подавлено записей уровня {logging.getLevelName(level)}: {count}")
+            for level, count in self.dropped.items()
+        ]
+        self.counts.clear()
+        self.dropped.clear()
+        self.last_flush = now
+        return records
+
+    def _record(self, level, message):
+        return logging.LogRecord("scanner", level, __file__, 0, message, None, None)
+
+    def flush(self):
+        with self.lock:
+            summary = self._take(time.monotonic())
+        for item in summary:
+            self.handler.enqueue(self.handler.prepare(item))
+
+_listener = None
+_sampler = None
+
+def setup_logging(filename="scanner.log", level=logging.INFO, stream=False, rates=None, interval=10.0):
+    # Повторный вызов ничего не меняет: логирование настраивается один раз на процесс
+    global _listener, _sampler
+    if _listener is not None:
+        return _listener
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if filename:
+        file_handler = logging.FileHandler(filename, encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    if stream:
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(formatter)
+        handlers.append(stream_handler)
+
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    _sampler = LogSampler(queue_handler, rates, interval)
+    queue_handler.addFilter(_sampler)
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(records, *handlers)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    # Дописывает накопленные сводки и ждет, пока поток запишет очередь
+    global _listener
+    if _listener is None:
+        return
+    _sampler.flush()
+    _listener.stop()
+    _listener = None
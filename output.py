@@ -0,0 +1,296 @@
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import zlib
+from datetime import datetime
+
+from records import ServerStatus, to_json, favicon_blob, is_favicon_blob, register_favicon
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен: без него доступны только .ndjson и .ndjson.gz
+    zstandard = None
+
+# Потоковая запись результатов: одна компактная JSON-строка на сервер (NDJSON),
+# по мере обнаружения. Сжатие выбирается по расширению: .gz или .zst
+NDJSON_SUFFIXES = (".ndjson", ".jsonl", ".ndjson.gz", ".jsonl.gz", ".ndjson.zst", ".jsonl.zst")
+
+def is_ndjson(filename):
+    return filename.lower().endswith(NDJSON_SUFFIXES)
+
+def _compression(filename):
+    name = filename.lower()
+    if name.endswith(".gz"):
+        return "gzip"
+    if name.endswith(".zst"):
+        return "zstd"
+    return None
+
+def dumps_compact(result):
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"), default=to_json)
+
+def favicon_sidecar(filename):
+    # Иконки NDJSON-файла лежат рядом, в results.favicons.ndjson: в самом файле -
+    # только записи серверов, по одной на строку (его читают jq, grep и т.п.)
+    lower = filename.lower()
+    for suffix in NDJSON_SUFFIXES:
+        if lower.endswith(suffix):
+            return filename[:-len(suffix)] + ".favicons.ndjson"
+    return filename + ".favicons.ndjson"
+
+def split_favicon(result, seen):
+    # Запись для файла ссылается на иконку по favicon_hash. Сама иконка возвращается
+    # отдельно при первом упоминании (seen - уже записанные хеши; None - иконки не пишутся,
+    # они лежат в каталоге хранилища favicon)
+    record = ServerStatus.from_dict(result)
+    key = record.favicon_hash
+    blob = None
+    if seen is not None and key and key not in seen:
+        seen.add(key)
+        blob = favicon_blob(key)
+    return blob, record.to_dict(favicon=False)
+
+class ResultWriter:
+    # fsync_every - через сколько записей сбрасывать данные на диск:
+    # при падении посреди сканирования теряется не больше этого числа серверов
+    def __init__(self, filename, fsync_every=50, compression="auto", favicons=True):
+        self.filename = filename
+        self.fsync_every = fsync_every
+        self.favicons = set() if favicons else None
+        self.sidecar = None  # файл иконок открывается при первой иконке
+        self.compression = _compression(filename) if compression == "auto" else compression
+        self.count = 0
+        self.pending = 0
+        self.raw = open(filename, "wb")
+        if self.compression == "gzip":
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode="wb")
+        elif self.compression == "zstd":
+            if zstandard is None:
+                self.raw.close()
+                raise RuntimeError("Для сжатия .zst установите пакет zstandard")
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+
+    def write(self, result):
+        blob, record = split_favicon(result, self.favicons)
+        if blob:
+            if self.sidecar is None:
+                self.sidecar = open(favicon_sidecar(self.filename), "w", encoding="utf-8")
+            self.sidecar.write(dumps_compact(blob) + "\n")
+        self.stream.write((dumps_compact(record) + "\n").encode("utf-8"))
+        self.count += 1
+        self.pending += 1
+        if self.fsync_every and self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        if self.compression == "gzip":
+            self.stream.flush(zlib_mode=zlib.Z_SYNC_FLUSH)
+        elif self.compression == "zstd":
+            self.stream.flush(zstandard.FLUSH_BLOCK)
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        if self.sidecar is not None:
+            self.sidecar.flush()
+            os.fsync(self.sidecar.fileno())
+        self.pending = 0
+
+    def close(self):
+        if self.raw.closed:
+            return
+        if self.sidecar is not None:
+            self.sidecar.close()
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class StreamResultWriter:
+    # NDJSON в уже открытый поток (например, stdout в конвейере): строка на сервер,
+    # сброс буфера - раз в flush_every записей и при закрытии.
+    # Файла иконок у потока нет: записи несут только favicon_hash, сами иконки
+    # сохраняются с --favicon-dir
+    def __init__(self, stream, flush_every=50):
+        self.stream = stream
+        self.flush_every = flush_every
+        self.count = 0
+
+    def write(self, result):
+        _, record = split_favicon(result, None)
+        self.stream.write(dumps_compact(record) + "\n")
+        self.count += 1
+        if self.flush_every and self.count % self.flush_every == 0:
+            self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Колонки CSV; списки (игроки, моды, плагины) записываются через "; "
+CSV_FIELDS = ["ip", "port", "motd", "version", "protocol", "players_online", "players_max", "players_sample",
+              "forge", "mods", "plugins", "core", "ping", "map"]
+
+def csv_row(result):
+    row = []
+    for field in CSV_FIELDS:
+        value = result.get(field)
+        row.append("; ".join(str(v) for v in value) if isinstance(value, (list, tuple)) else value)
+    return row
+
+class CsvResultWriter(StreamResultWriter):
+    def __init__(self, filename, flush_every=50):
+        self.filename = filename
+        stream = sys.stdout if filename == "-" else open(filename, "w", encoding="utf-8", newline="")
+        super().__init__(stream, flush_every)
+        self.csv = csv.writer(stream)
+        self.csv.writerow(CSV_FIELDS)
+
+    def write(self, result):
+        self.csv.writerow(csv_row(result))
+        self.count += 1
+        if self.flush_every and self.count % self.flush_every == 0:
+            self.stream.flush()
+
+    def close(self):
+        if self.stream is sys.stdout:
+            self.stream.flush()
+        elif not self.stream.closed:
+            self.stream.close()
+
+class JsonResultWriter:
+    # Один JSON-документ пишется только в конце, поэтому результаты копятся в памяти.
+    # Иконки собраны в "favicons" (хеш -> data:...) по одной на хеш
+    def __init__(self, filename, favicons=True):
+        self.filename = filename
+        self.results = []
+        self.favicons = set() if favicons else None
+        self.blobs = {}
+        self.count = 0
+
+    def write(self, result):
+        blob, record = split_favicon(result, self.favicons)
+        if blob:
+            self.blobs[blob["favicon_hash"]] = blob["favicon"]
+        self.results.append(record)
+        self.count += 1
+
+    def close(self):
+        if self.results is None:
+            return
+        data = {
+            "scanned_at": datetime.utcnow().isoformat(),
+            "servers_found": len(self.results),
+            "favicons": self.blobs,
+            "results": self.results
+        }
+        if self.filename == "-":
+            json.dump(data, sys.stdout, ensure_ascii=False, separators=(",", ":"), default=to_json)
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+        else:
+            with open(self.filename, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"), default=to_json)
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+OUTPUT_FORMATS = ("ndjson", "csv", "json")
+
+def guess_format(filename):
+    if filename != "-" and filename.lower().endswith(".csv"):
+        return "csv"
+    if filename != "-" and filename.lower().endswith(".json"):
+        return "json"
+    return "ndjson"
+
+def open_writer(filename, fmt=None, favicons=True):
+    # "-" - запись в stdout; формат по умолчанию определяется по расширению.
+    # favicons=False - в файл попадают только favicon_hash (иконки в каталоге хранилища)
+    fmt = fmt or guess_format(filename)
+    if fmt == "csv":
+        return CsvResultWriter(filename)
+    if fmt == "json":
+        return JsonResultWriter(filename, favicons)
+    if filename == "-":
+        return StreamResultWriter(sys.stdout)
+    return ResultWriter(filename, favicons=favicons)
+
+def _open_text(filename):
+    compression = _compression(filename)
+    if compression == "gzip":
+        return gzip.open(filename, "rt", encoding="utf-8")
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Для чтения .zst установите пакет zstandard")
+        raw = open(filename, "rb")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True),
+                                encoding="utf-8")
+    return open(filename, "r", encoding="utf-8")
+
+def _to_record(item):
+    # Неполные и чужие записи отдаются как есть - их отбрасывает тот, кто читает
+    if isinstance(item, dict) and "ip" in item and "port" in item:
+        return ServerStatus.from_dict(item)
+    return item
+
+def _iter_records(items):
+    # Строки-иконки ({"favicon_hash", "favicon"}) идут в хранилище, а не в результаты
+    # (так писались иконки прямо в NDJSON до появления файла иконок)
+    for item in items:
+        if is_favicon_blob(item):
+            register_favicon(item["favicon"], item["favicon_hash"])
+        else:
+            yield _to_record(item)
+
+def iter_results_file(filename):
+    # Потоковое чтение NDJSON без загрузки файла целиком.
+    # Старые JSON-документы ({"results": [...]}) тоже читаются, но уже целиком
+    if not is_ndjson(filename):
+        with open(filename, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            yield from _iter_records(data)
+            return
+        for key, favicon in (data.get("favicons") or {}).items():
+            register_favicon(favicon, key)
+        yield from _iter_records(data.get("results", []))
+        return
+    sidecar = favicon_sidecar(filename)
+    if os.path.exists(sidecar):
+        for _ in iter_results_file(sidecar):
+            pass
+    with _open_text(filename) as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя строка после падения - пропускаем
+                    continue
+                yield from _iter_records((item,))
+        except EOFError:
+            # Сжатый файл, оборванный при падении: все целые строки уже прочитаны
+            return
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import socket
+import time
+from collections import deque
+
+from mcstatus.motd import Motd
+from mcstatus.responses import ForgeData
+
+from records import ServerStatus
+from scanner_async import classify_error, retry_or_give_up, detect_core, DEFAULT_RETRY_POLICY
+
+# Запрос статуса без объектов mcstatus на каждую попытку: рукопожатие кодируется
+# один раз на хост (меняется только порт), ответ читается в заранее выделенный
+# буфер, длины пакетов разбираются прямо в нем, а JSON декодируется, только если
+# порт действительно ответил. mcstatus нужен лишь для разбора MOTD и данных Forge
+# у ответивших серверов
+PROTOCOL_VERSION = 47  # как у mcstatus: на статус сервер отвечает при любой версии
+NEXT_STATE_STATUS = b"\x01"
+STATUS_REQUEST = b"\x01\x00"  # длина 1, пакет 0x00
+# Длину пакета сообщает сам сервер (VarInt до 2^35): больше этого - ошибка протокола,
+# а не повод выделять буфер. Реальные ответы даже с тысячами модов намного меньше
+MAX_PACKET_SIZE = 2 * 1024 * 1024
+
+def encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def read_varint(buf, pos, end):
+    # (значение, позиция после него) или None, если байтов пока не хватает
+    value = 0
+    for shift in range(0, 35, 7):
+        if pos >= end:
+            return None
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+    raise ValueError("VarInt is too big")
+
+def handshake_prefix(host):
+    # Все, что идет до порта: длина пакета, id 0x00, версия протокола, адрес.
+    # Порт всегда занимает 2 байта, поэтому длину можно посчитать заранее
+    address = host.encode("utf-8")
+    body = b"\x00" + encode_varint(PROTOCOL_VERSION) + encode_varint(len(address)) + address
+    return encode_varint(len(body) + 2 + len(NEXT_STATE_STATUS)) + body
+
+class RawStatusProber:
+    # Проба для scanner_async.iter_scan (probe=): вызывается как probe(ip, port, timeout, stats=...)
+    # и возвращает ServerStatus или None, как scan_port_async
+    def __init__(self, retries=2, policy=None, buffer_size=64 * 1024, max_hosts=4096):
+        self.retries = retries
+        self.policy = policy or DEFAULT_RETRY_POLICY
+        self.buffer_size = buffer_size
+        self.max_hosts = max_hosts
+        self.hosts = {}  # хост -> (семейство, адрес, префикс рукопожатия)
+        self.buffers = deque()  # свободные буферы; их не больше, чем одновременных проб
+
+    async def __call__(self, ip, port, timeout=2.0, stats=None):
+        spent = {}
+        for attempt in range(self.retries):
+            started = time.monotonic()
+            try:
+                async with asyncio.timeout(timeout):
+                    return await self.probe(ip, port)
+            except (asyncio.TimeoutError, OSError) as e:
+                kind = classify_error(e)
+                if stats:
+                    stats.record_failure("status", kind, time.monotonic() - started)
+                logging.info(f"Attempt {attempt + 1} {kind} for {ip}:{port}: {e}",
+                             extra={"aggregate": f"status attempts failed ({kind})"})
+                if not await retry_or_give_up(kind, attempt, self.retries, spent, self.policy, stats):
+                    break
+            except Exception as e:
+                # Ответ не похож на статус Minecraft (в том числе серверы до 1.7) или
+                # разбирается с ошибкой: странный ответ одного сервера не должен обрывать сканирование
+                if stats:
+                    stats.record_failure("status", "protocol", time.monotonic() - started)
+                logging.warning(f"Error scanning {ip}:{port}: {e}", extra={"aggregate": "status protocol errors"})
+                return None
+        logging.info(f"All attempts failed for {ip}:{port}", extra={"aggregate": "status probes failed"})
+        return None
+
+    async def host(self, ip):
+        entry = self.hosts.get(ip)
+        if entry is None:
+            info = await asyncio.get_running_loop().getaddrinfo(ip, None, type=socket.SOCK_STREAM)
+            family, _, _, _, sockaddr = info[0]
+            if len(self.hosts) >= self.max_hosts:
+                self.hosts.clear()
+            entry = self.hosts[ip] = (family, sockaddr[0], handshake_prefix(ip))
+        return entry
+
+    async def probe(self, ip, port):
+        loop = asyncio.get_running_loop()
+        family, address, prefix = await self.host(ip)
+        request = prefix + port.to_bytes(2, "big") + NEXT_STATE_STATUS + STATUS_REQUEST
+        buf = self.buffers.pop() if self.buffers else bytearray(self.buffer_size)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.setblocking(False)
+            await loop.sock_connect(sock, (address, port))
+            started = time.monotonic()
+            await loop.sock_sendall(sock, request)
+            buf, start, end, ping = await self.read_response(loop, sock, buf, started)
+            return self.decode(ip, port, buf[start:end], ping)
+        finally:
+            sock.close()
+            if len(buf) == self.buffer_size:
+                self.buffers.append(buf)
+
+    async def read_response(self, loop, sock, buf, started):
+        # Читает один пакет ответа: (буфер, начало JSON, конец JSON, пинг в мс).
+        # Пинг - время от запроса до первых байт ответа, без отдельного обмена ping/pong
+        filled = 0
+        ping = None
+        needed = None
+        while True:
+            if filled == len(buf):
+                # Ответ больше буфера (длинный список модов) - только для этого порта
+                grown = bytearray(max(len(buf) * 2, needed or 0))
+                grown[:filled] = buf[:filled]
+                buf = grown
+            count = await loop.sock_recv_into(sock, memoryview(buf)[filled:])
+            if not count:
+                raise ConnectionResetError("Connection closed before status response")
+            if ping is None:
+                ping = (time.monotonic() - started) * 1000
+            filled += count
+            if needed is None:
+                header = self.parse_header(buf, filled)
+                if header is None:
+                    continue
+                needed, start, length = header
+                if needed > len(buf):
+                    grown = bytearray(needed)
+                    grown[:filled] = buf[:filled]
+                    buf = grown
+            if filled >= needed:
+                return buf, start, start + length, ping
+
+    def parse_header(self, buf, filled):
+        # Длина пакета, id, длина строки JSON - все VarInt прямо в буфере
+        packet = read_varint(buf, 0, filled)
+        if packet is None:
+            return None
+        packet_length, pos = packet
+        if packet_length > MAX_PACKET_SIZE:
+            raise ValueError(f"Status packet is too big ({packet_length} bytes)")
+        packet_id = read_varint(buf, pos, filled)
+        if packet_id is None:
+            return None
+        if packet_id[0] != 0:
+            raise ValueError(f"Unexpected packet id {packet_id[0]}")
+        text = read_varint(buf, packet_id[1], filled)
+        if text is None:
+            return None
+        length, start = text
+        if start + length > pos + packet_length:
+            raise ValueError("Status string is longer than the packet")
+        return pos + packet_length, start, length
+
+    def decode(self, ip, port, data, ping):
+        raw = json.loads(data)
+        version = raw["version"]["name"]
+        players = raw["players"]
+        forge_raw = raw.get("forgeData") or raw.get("modinfo")
+        mods = []
+        if forge_raw:
+            mods = [f"{m.name} {m.marker}" for m in ForgeData.build(forge_raw).mods]
+        return ServerStatus(
+            ip, port, Motd.parse(raw.get("description", ""), bedrock=False).to_minecraft(), version,
+            raw["version"]["protocol"], players["online"], players["max"],
+            [p["name"] for p in players.get("sample") or []], bool(forge_raw), mods, (),
+            detect_core(version), raw.get("favicon"), ping
+        )
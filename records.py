@@ -0,0 +1,116 @@
+import sys
+
+from favicons import FaviconStore
+
+# Запись о найденном сервере. Вместо словаря на 14 ключей - объект со __slots__:
+# строки версии и ядра интернированы (тысячи серверов делят несколько значений),
+# списки хранятся кортежами (пустой - один общий), а favicon хранится один раз
+# на всю программу и в записи представлен только хешем.
+# Для совместимости запись читается как словарь: r["ip"], r.get("favicon")
+FIELDS = ("ip", "port", "motd", "version", "protocol", "players_online", "players_max", "players_sample",
+          "forge", "mods", "plugins", "core", "favicon", "ping", "map")
+
+# Общее на процесс хранилище иконок. Точка входа может заменить его на хранилище
+# с каталогом PNG на диске (set_favicon_store) - до того, как появятся записи
+_favicons = FaviconStore()
+
+def favicon_store():
+    return _favicons
+
+def set_favicon_store(store):
+    global _favicons
+    for key, data in _favicons.items():
+        store.put(data, key)
+    _favicons = store
+
+def register_favicon(data, key=None):
+    return _favicons.put(data, key)
+
+def get_favicon(key):
+    return _favicons.get(key)
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _tuple(values):
+    return tuple(values) if values else ()
+
+class ServerStatus:
+    __slots__ = ("ip", "port", "motd", "version", "protocol", "players_online", "players_max", "players_sample",
+                 "forge", "mods", "plugins", "core", "favicon_hash", "ping", "map")
+
+    def __init__(self, ip, port, motd="", version="", protocol=None, players_online=0, players_max=0,
+                 players_sample=(), forge=False, mods=(), plugins=(), core="Vanilla", favicon=None, ping=None,
+                 map=None, favicon_hash=None):
+        self.ip = _intern(ip)
+        self.port = port
+        self.motd = motd
+        self.version = _intern(version)
+        self.protocol = protocol
+        self.players_online = players_online
+        self.players_max = players_max
+        self.players_sample = _tuple(players_sample)
+        self.forge = bool(forge)
+        self.mods = _tuple(mods)
+        self.plugins = _tuple(plugins)
+        self.core = _intern(core)
+        # favicon - строка data:..., favicon_hash - уже известный хеш (например, из базы)
+        self.favicon_hash = register_favicon(favicon, favicon_hash)
+        self.ping = ping
+        self.map = map  # карта из UDP Query, если сервер на него ответил
+
+    @property
+    def favicon(self):
+        # Ленивое поле: строка иконки достается из общего хранилища только по запросу
+        return get_favicon(self.favicon_hash)
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls):
+            return data
+        return cls(**{key: data[key] for key in FIELDS if key in data}, favicon_hash=data.get("favicon_hash"))
+
+    def to_dict(self, favicon=True):
+        # Стабильная сериализация для всех потребителей: порядок ключей FIELDS, списки - списками.
+        # favicon=False - без самой иконки, только favicon_hash
+        data = {key: getattr(self, key) for key in FIELDS}
+        data["players_sample"] = list(self.players_sample)
+        data["mods"] = list(self.mods)
+        data["plugins"] = list(self.plugins)
+        if not favicon:
+            data["favicon"] = None
+            data["favicon_hash"] = self.favicon_hash
+        return data
+
+    # Доступ как к словарю, чтобы код, работавший со словарями, не менялся
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in FIELDS else default
+
+    def __contains__(self, key):
+        return key in FIELDS
+
+    def keys(self):
+        return FIELDS
+
+    def __repr__(self):
+        return f"ServerStatus({self.ip}:{self.port}, {self.version!r}, {self.players_online}/{self.players_max})"
+
+def favicon_blob(key):
+    # Отдельная запись с самой иконкой: в файле результатов она пишется один раз,
+    # а записи серверов ссылаются на нее через favicon_hash
+    favicon = get_favicon(key)
+    return {"favicon_hash": key, "favicon": favicon} if favicon else None
+
+def is_favicon_blob(data):
+    return isinstance(data, dict) and "ip" not in data and bool(data.get("favicon_hash")) and bool(data.get("favicon"))
+
+def to_json(obj):
+    # default= для json.dump/json.dumps
+    if isinstance(obj, ServerStatus):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,107 @@
+import re
+from bisect import insort
+from collections import namedtuple
+
+# Коды форматирования Minecraft (§a, §l, ...) - для поиска и списка серверов они не нужны
+MOTD_CODES = re.compile("§.")
+
+def strip_color_codes(text):
+    return MOTD_CODES.sub("", text or "")
+
+# Условия фильтра списка серверов. Строки уже приведены к нижнему регистру
+Filter = namedtuple("Filter", ["players_only", "core", "version", "motd"])
+
+NO_FILTER = Filter(False, "all", "", "")
+
+def make_filter(players_only=False, core="all", version="", motd=""):
+    return Filter(bool(players_only), (core or "all").lower(), (version or "").lower(), strip_color_codes(motd).lower())
+
+def narrows(new, old):
+    # Все, что проходит new, проходит и old: можно искать среди прошлых совпадений
+    # (строка запроса выросла, добавился фильтр по игрокам или ядру)
+    return ((new.players_only or not old.players_only)
+            and (old.core == "all" or new.core == old.core)
+            and old.version in new.version
+            and old.motd in new.motd)
+
+class ResultIndex:
+    # Индекс найденных серверов для фильтрации и сортировки без повторных проходов
+    # по всем результатам: MOTD и версия хранятся уже в нижнем регистре и без кодов
+    # цвета, серверы разложены по ядрам, порядки по пингу и игрокам поддерживаются
+    # при каждом добавлении
+    def __init__(self):
+        self.results = []
+        self.clear()
+
+    def clear(self):
+        self.results.clear()
+        self.motd = []
+        self.version = []
+        self.core = []
+        self.by_core = {}
+        self.by_ping = []     # (ping, номер)
+        self.by_players = []  # (-игроки, номер)
+        self.last_filter = None
+        self.last_matches = []
+        self.last_size = 0
+
+    def __len__(self):
+        return len(self.results)
+
+    def add(self, result):
+        i = len(self.results)
+        self.results.append(result)
+        self.motd.append(strip_color_codes(result.get("motd")).lower())
+        self.version.append((result.get("version") or "").lower())
+        self.core.append((result.get("core") or "").lower())
+        self.by_core.setdefault(self.core[i], []).append(i)
+        insort(self.by_ping, (result.get("ping") or 0, i))
+        insort(self.by_players, (-(result.get("players_online") or 0), i))
+        return i
+
+    def extend(self, results):
+        for result in results:
+            self.add(result)
+
+    def matches(self, i, flt):
+        if flt.players_only and (self.results[i].get("players_online") or 0) <= 0:
+            return False
+        if flt.core != "all" and self.core[i] != flt.core:
+            return False
+        if flt.version and flt.version not in self.version[i]:
+            return False
+        if flt.motd and flt.motd not in self.motd[i]:
+            return False
+        return True
+
+    def _candidates(self, flt):
+        if self.last_filter is not None and narrows(flt, self.last_filter):
+            # Сужение прошлого запроса: проверяем прошлые совпадения и то, что пришло после
+            return self.last_matches + list(range(self.last_size, len(self.results)))
+        if flt.core != "all":
+            return self.by_core.get(flt.core, [])
+        return range(len(self.results))
+
+    def filter(self, flt):
+        # Номера подходящих серверов в порядке добавления
+        if flt == self.last_filter and self.last_size == len(self.results):
+            return self.last_matches
+        matches = [i for i in self._candidates(flt) if self.matches(i, flt)]
+        self.last_filter, self.last_matches, self.last_size = flt, matches, len(self.results)
+        return matches
+
+    def query(self, flt=NO_FILTER, order=None):
+        # order: None (порядок ответа), "ping" (по возрастанию) или "players" (по убыванию)
+        matches = self.filter(flt)
+        if order not in ("ping", "players"):
+            return [self.results[i] for i in matches]
+        if len(matches) * 8 < len(self.results):
+            # Совпадений мало - дешевле отсортировать только их
+            if order == "ping":
+                key = lambda i: (self.results[i].get("ping") or 0, i)
+            else:
+                key = lambda i: (-(self.results[i].get("players_online") or 0), i)
+            return [self.results[i] for i in sorted(matches, key=key)]
+        ordered = self.by_ping if order == "ping" else self.by_players
+        selected = set(matches)
+        return [self.results[i] for _, i in ordered if i in selected]
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+
+class ScanJob:
+    def __init__(self, service, name, func, args):
+        self.service = service
+        self.name = name
+        self.func = func
+        self.args = args
+        self.task = None
+        self.cancelled = False
+        self.done = threading.Event()
+
+    @property
+    def running(self):
+        return self.task is not None and not self.done.is_set()
+
+    def cancel(self):
+        # Можно вызывать из любого потока: задача отменяется внутри цикла событий
+        self.cancelled = True
+        self.service.loop.call_soon_threadsafe(self._cancel_task)
+
+    def _cancel_task(self):
+        if self.task is not None:
+            self.task.cancel()
+
+class ScanService:
+    # Один фоновый поток с постоянным циклом событий. Задания сканирования
+    # ставятся в очередь из потока Tk и выполняются в этом цикле по одному
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.pending = deque()
+        self.current = None
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="scan-service", daemon=True)
+        self.thread.start()
+        self.started.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        self.worker = self.loop.create_task(self._work())
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    async def _work(self):
+        while True:
+            while not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            job = self.pending.popleft()
+            if job.cancelled:
+                job.done.set()
+                continue
+            self.current = job
+            job.task = asyncio.ensure_future(job.func(*job.args))
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                if not job.task.cancelled():
+                    raise  # Отменен сам обработчик очереди - сервис останавливается
+                logging.info(f"Задание отменено: {job.name}")
+            except Exception as e:
+                logging.error(f"Ошибка в задании {job.name}: {e}")
+            finally:
+                self.current = None
+                job.done.set()
+
+    def submit(self, name, func, *args):
+        # func - асинхронная функция, выполняется в цикле сервиса
+        job = ScanJob(self, name, func, args)
+        self.loop.call_soon_threadsafe(self._enqueue, job)
+        return job
+
+    def _enqueue(self, job):
+        self.pending.append(job)
+        self.wakeup.set()
+
+    def busy(self):
+        return self.current is not None or bool(self.pending)
+
+    def cancel_all(self):
+        for job in list(self.pending):
+            job.cancel()
+        job = self.current
+        if job is not None:
+            job.cancel()
+
+    def stop(self, timeout=5.0):
+        self.cancel_all()
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+class UiPump:
+    # Вызовы из потока сканирования в поток Tk. Виджеты меняет только Tk:
+    # накопившиеся вызовы выполняются пачкой раз в interval мс одним after()
+    def __init__(self, root, interval=50, batch=2000):
+        self.root = root
+        self.interval = interval
+        self.batch = batch
+        self.calls = deque()
+        self.job = self.root.after(self.interval, self._drain)
+
+    def post(self, func, *args):
+        # Безопасно из любого потока: deque.append атомарен
+        self.calls.append((func, args))
+
+    def _drain(self):
+        for _ in range(min(self.batch, len(self.calls))):
+            func, args = self.calls.popleft()
+            try:
+                func(*args)
+            except Exception as e:
+                logging.error(f"Ошибка обновления интерфейса: {e}")
+        self.job = self.root.after(self.interval, self._drain)
+
+    def stop(self):
+        if self.job:
+            self.root.after_cancel(self.job)
+            self.job = None
+
+class RescanPlan:
+    # Многоуровневая автопроверка: "горячие" адреса (где уже находились серверы)
+    # перепроверяются на каждом срабатывании таймера, а полный диапазон -
+    # не чаще раза в full_interval секунд. Адрес, не ответивший drop_after раз
+    # подряд, выпадает из горячих до следующего полного прохода
+    def __init__(self, full_interval=3600.0, tiered=True, drop_after=3):
+        self.full_interval = full_interval
+        self.tiered = tiered
+        self.drop_after = drop_after
+        self.last_full = None
+        self.hot = {}  # (ip, port) -> число промахов подряд
+        # Цели и порты полного прохода, из которого взяты горячие адреса:
+        # горячая перепроверка относится к ним, а не к тому, что сейчас в полях ввода
+        self.hosts = None
+        self.ports = None
+
+    def due(self, now):
+        if not self.tiered or self.last_full is None or now - self.last_full >= self.full_interval:
+            return "full"
+        return "hot"
+
+    def hot_targets(self):
+        return sorted(self.hot)
+
+    def record_full(self, now, found, hosts=None, ports=None):
+        self.last_full = now
+        self.hot = {key: 0 for key in found}
+        self.hosts = hosts
+        self.ports = ports
+
+    def record_hot(self, probed, found):
+        found = set(found)
+        for key in probed:
+            if key in found:
+                self.hot[key] = 0
+            elif key in self.hot:
+                self.hot[key] += 1
+                if self.hot[key] >= self.drop_after:
+                    del self.hot[key]
@@ -1,19 +1,76 @@
+import argparse
 import asyncio
 import socket
-import json
-from datetime import datetime
+import logging
+import os
+import sys
+import time
+from collections import deque
+from contextlib import nullcontext
+from functools import partial
 from mcstatus import JavaServer
 from rich.console import Console
+from rich.live import Live
 from rich.table import Table
 from rich import box
 
+from scanner_async import iter_scan, ScanStats, ScanProgress, classify_error, retry_or_give_up, detect_core, DEFAULT_RETRY_POLICY
+from bedrock import iter_bedrock_scan, BEDROCK_PORT
+from raw_status import RawStatusProber
+from records import ServerStatus, set_favicon_store
+from favicons import FaviconStore
+from output import is_ndjson, iter_results_file, open_writer, OUTPUT_FORMATS
+from targets import parse_hosts, parse_ports, iter_targets, count_hosts, count_ports
+from logsetup import setup_logging
+
 console = Console()
 
-async def scan_port(ip, port, timeout=1.0, retries=2):
+class ScanView:
+    # Живая сводка сканирования в терминале. Пробы только отдают данные: add()
+    # лишь запоминает сервер, а перерисовка идет в отдельном потоке rich.live
+    # с фиксированной частотой кадров, сколько бы серверов ни отвечало
+    def __init__(self, progress, fps=4, rows=15):
+        self.progress = progress
+        self.rows = rows
+        self.recent = deque(maxlen=rows)
+        self.live = Live(get_renderable=self.render, refresh_per_second=fps, console=console, transient=True)
+
+    def add(self, result):
+        self.recent.append(result)
+
+    def render(self):
+        percent, rate, eta = self.progress.sample()
+        status = f"[bold green]{percent:5.1f}%[/bold green]  {rate:.0f} проб/с  найдено: {self.progress.found}"
+        if eta is not None:
+            status += f"  осталось: {int(eta) // 60}:{int(eta) % 60:02d}"
+        table = Table(title="Последние найденные серверы", box=box.SIMPLE_HEAD, caption=status)
+        table.add_column("IP:Port", style="cyan", no_wrap=True)
+        table.add_column("MOTD", style="blue")
+        table.add_column("Версия", style="magenta")
+        table.add_column("Игроки", style="green")
+        table.add_column("Core", style="yellow")
+        table.add_column("Ping", style="yellow")
+        for r in list(self.recent):
+            motd = r["motd"].replace("\n", " ")
+            table.add_row(f"{r['ip']}:{r['port']}", motd[:30] + ("..." if len(motd) > 30 else ""), r["version"],
+                          f"{r['players_online']}/{r['players_max']}", r["core"], f"{r['ping']:.0f} ms")
+        return table
+
+    def __enter__(self):
+        self.live.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.live.stop()
+
+async def scan_port(ip, port, timeout=1.0, retries=2, stats=None, policy=None):
+    policy = policy or DEFAULT_RETRY_POLICY
+    spent = {}
     for attempt in range(retries):
+        started = time.monotonic()
         try:
             server = JavaServer(ip, port)
-            status = await asyncio.wait_for(server.async_status(), timeout=timeout)
+            status = await asyncio.wait_for(server.async_status(tries=1), timeout=timeout)
 
             motd = getattr(status.description, "to_minecraft", lambda: str(status.description))()
             version = status.version.name
@@ -30,132 +87,247 @@ async def scan_port(ip, port, timeout=1.0, retries=2):
 
             plugins = status.software.plugins if getattr(status, "software", None) else []
 
-            core = "Vanilla"
-            if "Paper" in version:
-                core = "Paper"
-            elif "Spigot" in version:
-                core = "Spigot"
-            elif "Forge" in version:
-                core = "Forge"
-            elif "Fabric" in version:
-                core = "Fabric"
-
-            favicon = bool(getattr(status, "icon", None))
+            core = detect_core(version)
+
+            favicon = getattr(status, "icon", None)
             ping = status.latency
 
-            # Красивый вывод в консоль
-            table = Table(title=f"Сервер найден: {ip}:{port}", box=box.ROUNDED, style="bold white")
-            table.add_column("Параметр", style="cyan", no_wrap=True)
-            table.add_column("Значение", style="magenta")
-
-            table.add_row("MOTD", f"[blue]{motd}[/blue]")
-            table.add_row("Версия", f"{version} (протокол {protocol})")
-            table.add_row("Игроки", f"{players_online}/{players_max} {players_sample}")
-            table.add_row("Forge", "[green]✔[/green]" if forge else "[red]✘[/red]")
-            table.add_row("Core", f"[yellow]{core}[/yellow]")
-            table.add_row("Favicon", "[green]Есть[/green]" if favicon else "[red]Нет[/red]")
-            table.add_row("Ping", f"[cyan]{ping} ms[/cyan]")
-
-            console.print(table)
-
-            return {
-                "ip": ip,
-                "port": port,
-                "motd": motd,
-                "version": version,
-                "protocol": protocol,
-                "players_online": players_online,
-                "players_max": players_max,
-                "players_sample": players_sample,
-                "forge": forge,
-                "mods": mods,
-                "plugins": plugins,
-                "core": core,
-                "favicon": favicon,
-                "ping": ping
-            }
-
-        except (asyncio.TimeoutError, socket.timeout, ConnectionRefusedError, OSError):
-            continue
+            return ServerStatus(ip, port, motd, version, protocol, players_online, players_max, players_sample,
+                                forge, mods, plugins, core, favicon, ping)
+
+        except (asyncio.TimeoutError, socket.timeout, ConnectionRefusedError, OSError) as e:
+            kind = classify_error(e)
+            if stats:
+                stats.record_failure("status", kind, time.monotonic() - started)
+            if not await retry_or_give_up(kind, attempt, retries, spent, policy, stats):
+                break
         except Exception as e:
-            console.print(f"[red][!][/red] Ошибка на {ip}:{port} → {e}")
-            continue
+            if stats:
+                stats.record_failure("status", "protocol", time.monotonic() - started)
+            logging.debug(f"Protocol error on {ip}:{port}: {e}")
+            break
 
     return None
 
-async def scan_ports(ip, start_port=25565, end_port=25600, timeout=1.0, concurrency=100):
-    tasks = []
-    sem = asyncio.Semaphore(concurrency)
+async def scan_ports(ip, start_port=25565, end_port=25600, timeout=1.0, concurrency=100,
+                     connect_timeout=0.5, connect_concurrency=1000, per_host_limit=None, ports=None, stats=None,
+                     writer=None, retries=2, adaptive=True, progress=None, view=None, probe=None, **stages):
+    # Серверы приходят по мере ответа. ip и ports принимают списки целей так же,
+    # как scanner_async.scan_ports. writer (output.ResultWriter и др.) получает
+    # каждый сервер сразу, а не в конце; view (ScanView) - для живой сводки.
+    # stages - стадии legacy/query движка (см. scanner_async.scan_pipeline),
+    # probe - другая реализация запроса статуса, например raw_status.RawStatusProber()
+    hosts = parse_hosts(ip)
+    ports = parse_ports(ports) if ports else [(start_port, end_port)]
+    probe = probe or partial(scan_port, retries=retries)
+    return await collect(iter_scan(iter_targets(hosts, ports), probe=probe, timeout=timeout, adaptive=adaptive,
+                                   progress=progress, total=count_hosts(hosts) * count_ports(ports),
+                                   concurrency=concurrency, connect_timeout=connect_timeout,
+                                   connect_concurrency=connect_concurrency, per_host_limit=per_host_limit,
+                                   stats=stats, **stages), writer, view)
+
+async def scan_bedrock_ports(ip, ports, timeout=1.0, rate=20000, stats=None, writer=None, progress=None, view=None):
+    # Bedrock Edition: UDP-пинг всего диапазона с одного сокета (см. bedrock.py)
+    hosts = parse_hosts(ip)
+    ports = parse_ports(ports)
+    if progress is not None:
+        progress.total = count_hosts(hosts) * count_ports(ports)
+    return await collect(iter_bedrock_scan(iter_targets(hosts, ports), timeout=timeout, rate=rate,
+                                           progress=progress, stats=stats), writer, view)
 
-    async def sem_task(port):
-        async with sem:
-            return await scan_port(ip, port, timeout)
+async def collect(servers, writer=None, view=None):
+    results = []
+    async for r in servers:
+        results.append(r)
+        if writer:
+            writer.write(r)
+        if view:
+            view.add(r)
+    return results
 
-    for port in range(start_port, end_port + 1):
-        tasks.append(asyncio.create_task(sem_task(port)))
+def print_summary(results):
+    table = Table(title="Итоговый список серверов", box=box.MINIMAL_DOUBLE_HEAD)
+    table.add_column("IP:Port", style="cyan")
+    table.add_column("MOTD", style="blue")
+    table.add_column("Версия", style="magenta")
+    table.add_column("Игроки", style="green")
+    table.add_column("Ping", style="yellow")
 
-    results = await asyncio.gather(*tasks)
-    return [r for r in results if r is not None]
+    for r in results:
+        table.add_row(
+            f"{r['ip']}:{r['port']}",
+            r["motd"][:30] + ("..." if len(r["motd"]) > 30 else ""),
+            r["version"],
+            f"{r['players_online']}/{r['players_max']}",
+            f"{r['ping']} ms"
+        )
 
-def save_results(results, filename="results.json"):
-    data = {
-        "scanned_at": datetime.utcnow().isoformat(),
-        "servers_found": len(results),
-        "results": results
-    }
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    console.print(f"[bold green]✔ Результаты сохранены в {filename}[/bold green]")
+    console.print(table)
 
 def get_user_input():
     console.print("[bold cyan]Введите параметры сканирования (нажмите Enter для значений по умолчанию):[/bold cyan]")
-    
-    ip = input("IP-адрес (по умолчанию 147.185.221.31): ").strip() or "147.185.221.31"
-    
+    console.print("[dim]Цели: IP, подсети (10.0.0.0/24), диапазоны (10.0.0.1-50), имена хостов, @файл; через запятую[/dim]")
+
     while True:
         try:
-            start_port_input = input("Начальный порт (по умолчанию 36000): ").strip() or "36000"
-            start_port = int(start_port_input)
-            if start_port < 1 or start_port > 65535:
-                raise ValueError("Порт должен быть от 1 до 65535")
+            hosts = input("Цели (по умолчанию 147.185.221.31): ").strip() or "147.185.221.31"
+            parse_hosts(hosts)
             break
-        except ValueError as e:
+        except (ValueError, OSError) as e:
             console.print(f"[red]Ошибка: {e}. Попробуйте снова.[/red]")
 
     while True:
         try:
-            end_port_input = input("Конечный порт (по умолчанию 50000): ").strip() or "50000"
-            end_port = int(end_port_input)
-            if end_port < start_port or end_port > 65535:
-                raise ValueError("Конечный порт должен быть больше начального и до 65535")
+            ports = input("Порты, например 25565,36000-50000 (по умолчанию 36000-50000): ").strip() or "36000-50000"
+            parse_ports(ports)
             break
         except ValueError as e:
             console.print(f"[red]Ошибка: {e}. Попробуйте снова.[/red]")
 
-    return ip, start_port, end_port
+    return hosts, ports
 
-if __name__ == "__main__":
-    ip, start_port, end_port = get_user_input()
-    console.print(f"[bold green]Сканирование {ip} с портов {start_port} до {end_port}...[/bold green]")
-    results = asyncio.run(scan_ports(ip, start_port, end_port, timeout=0.7, concurrency=50))
+EXIT_FOUND = 0  # найден хотя бы один сервер
+EXIT_NOT_FOUND = 1  # сканирование прошло, серверов нет
+EXIT_USAGE = 2  # неверные аргументы (так же завершается argparse)
+EXIT_ERROR = 3  # ошибка записи результатов или сканирования
+EXIT_INTERRUPTED = 130
 
-    if results:
-        table = Table(title="Итоговый список серверов", box=box.MINIMAL_DOUBLE_HEAD)
-        table.add_column("IP:Port", style="cyan")
-        table.add_column("MOTD", style="blue")
-        table.add_column("Версия", style="magenta")
-        table.add_column("Игроки", style="green")
-        table.add_column("Ping", style="yellow")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Сканер Minecraft-серверов",
+        epilog="Коды выхода: 0 - серверы найдены, 1 - не найдены, 2 - неверные аргументы, "
+               "3 - ошибка, 130 - прервано. Без целей и в терминале параметры запрашиваются интерактивно."
+    )
+    parser.add_argument("targets", nargs="?",
+                        help="цели: IP, подсети (10.0.0.0/24), диапазоны (10.0.0.1-50), имена хостов, @файл; "
+                             "или сохраненный файл результатов для просмотра")
+    parser.add_argument("-p", "--ports",
+                        help="порты, например 25565,36000-50000 (по умолчанию 36000-50000, с --bedrock - 19132)")
+    parser.add_argument("-c", "--concurrency", type=int, default=50, help="одновременных запросов статуса")
+    parser.add_argument("--connect-concurrency", type=int, default=1000, help="одновременных TCP-подключений")
+    parser.add_argument("--per-host-limit", type=int, default=None, help="максимум одновременных проверок одного хоста")
+    parser.add_argument("-t", "--timeout", type=float, default=0.7, help="таймаут запроса статуса, сек")
+    parser.add_argument("--connect-timeout", type=float, default=0.3, help="таймаут TCP-подключения, сек")
+    parser.add_argument("-r", "--retries", type=int, default=1, help="повторов запроса статуса после ошибки")
+    parser.add_argument("--no-adaptive", action="store_true", help="не подстраивать таймауты под RTT хоста")
+    parser.add_argument("--backend", choices=("mcstatus", "raw"), default="mcstatus",
+                        help="запрос статуса: через mcstatus или собственный облегченный (raw)")
+    parser.add_argument("--legacy", action="store_true",
+                        help="старый пинг 0xFE для открытых портов без ответа на статус (серверы до 1.7)")
+    parser.add_argument("--query", action="store_true",
+                        help="UDP Query для найденных серверов: плагины, карта, все игроки")
+    parser.add_argument("--query-timeout", type=float, default=1.0, help="таймаут UDP Query и старого пинга, сек")
+    parser.add_argument("--query-concurrency", type=int, default=20,
+                        help="одновременных запросов UDP Query и старого пинга")
+    parser.add_argument("--favicon-retry", action="store_true",
+                        help="повторный запрос статуса ради favicon, если сервер ответил без иконки")
+    parser.add_argument("--bedrock", action="store_true",
+                        help="искать серверы Bedrock Edition: UDP-пинг RakNet вместо протокола Java")
+    parser.add_argument("--rate", type=int, default=20000, help="UDP-запросов в секунду в режиме --bedrock")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, help="формат вывода (по умолчанию - по расширению)")
+    parser.add_argument("-o", "--output", default="results.ndjson", help="файл результатов или - для stdout")
+    parser.add_argument("--favicon-dir",
+                        help="каталог для иконок (PNG по хешу); в файл результатов тогда пишется только favicon_hash")
+    parser.add_argument("--log", default="scanner.log", help="файл лога")
+    parser.add_argument("-q", "--quiet", action="store_true", help="не печатать найденные серверы и итоговую таблицу")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1 or args.connect_concurrency < 1 or args.query_concurrency < 1 or args.retries < 0 \
+            or args.timeout <= 0 or args.connect_timeout <= 0 or args.query_timeout <= 0 or args.rate < 1:
+        parser.error("concurrency и rate должны быть больше 0, retries - не меньше 0, таймауты - больше 0")
+    args.ports = args.ports or (str(BEDROCK_PORT) if args.bedrock else "36000-50000")
+    return args
 
-        for r in results:
-            table.add_row(
-                f"{r['ip']}:{r['port']}",
-                r["motd"][:30] + ("..." if len(r["motd"]) > 30 else ""),
-                r["version"],
-                f"{r['players_online']}/{r['players_max']}",
-                f"{r['ping']} ms"
-            )
+def is_results_file(path):
+    return os.path.isfile(path) and (is_ndjson(path) or path.lower().endswith(".json"))
 
-        console.print(table)
+def main(argv=None):
+    global console
+    args = parse_args(argv)
+    setup_logging(args.log)
+    if args.favicon_dir:
+        set_favicon_store(FaviconStore(args.favicon_dir))
 
-    save_results(results)
\ No newline at end of file
+    # python3 scanner.py results.ndjson - показать сохраненные результаты без сканирования
+    if args.targets and is_results_file(args.targets):
+        try:
+            print_summary(iter_results_file(args.targets))
+        except Exception as e:
+            logging.exception(f"Не удалось прочитать {args.targets}")
+            console.print(f"[red]Ошибка чтения {args.targets}: {e!r}[/red]")
+            return EXIT_ERROR
+        return EXIT_FOUND
+
+    to_stdout = args.output == "-"
+    if to_stdout:
+        # stdout занят данными - сообщения уходят в stderr
+        console = Console(stderr=True)
+    # Живая сводка нужна только человеку за терминалом
+    show = sys.stdout.isatty() and not to_stdout and not args.quiet
+
+    if args.targets:
+        hosts, ports = args.targets, args.ports
+        try:
+            parse_hosts(hosts)
+            parse_ports(ports)
+        except (ValueError, OSError) as e:
+            console.print(f"[red]Ошибка: {e}[/red]")
+            return EXIT_USAGE
+    elif sys.stdin.isatty():
+        hosts, ports = get_user_input()
+    else:
+        console.print("[red]Не указаны цели сканирования[/red]")
+        return EXIT_USAGE
+
+    if show:
+        console.print(f"[bold green]Сканирование {hosts}, порты {ports}...[/bold green]")
+    stats = ScanStats()
+    progress = ScanProgress()
+    try:
+        # Каждый найденный сервер сразу дописывается в файл результатов
+        with open_writer(args.output, args.format, favicons=not args.favicon_dir) as writer, \
+                (ScanView(progress) if show else nullcontext()) as view:
+            if args.bedrock:
+                scan = scan_bedrock_ports(hosts, ports, timeout=args.timeout, rate=args.rate, stats=stats,
+                                          writer=writer, progress=progress, view=view)
+            else:
+                probe = RawStatusProber(retries=args.retries + 1) if args.backend == "raw" else None
+                scan = scan_ports(hosts, ports=ports, timeout=args.timeout, concurrency=args.concurrency,
+                                  connect_timeout=args.connect_timeout, connect_concurrency=args.connect_concurrency,
+                                  per_host_limit=args.per_host_limit, stats=stats, writer=writer,
+                                  retries=args.retries + 1, adaptive=not args.no_adaptive, progress=progress,
+                                  view=view, legacy=args.legacy, legacy_timeout=args.query_timeout,
+                                  legacy_concurrency=args.query_concurrency, query=args.query,
+                                  query_timeout=args.query_timeout, query_concurrency=args.query_concurrency,
+                                  favicon_retry=args.favicon_retry, probe=probe)
+            results = asyncio.run(scan)
+    except KeyboardInterrupt:
+        console.print("[yellow]Сканирование прервано[/yellow]")
+        return EXIT_INTERRUPTED
+    except BrokenPipeError:
+        # Читатель конвейера закрылся раньше (например, head) - это не ошибка;
+        # код выхода - по тому, нашлись ли серверы до закрытия конвейера
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return EXIT_FOUND if progress.found else EXIT_NOT_FOUND
+    except (OSError, RuntimeError) as e:
+        console.print(f"[red]Ошибка: {e}[/red]")
+        return EXIT_ERROR
+    except Exception as e:
+        # Любой другой сбой - тоже ошибка, а не "серверов нет": cron должен их различать
+        logging.exception("Сканирование завершилось с ошибкой")
+        console.print(f"[red]Непредвиденная ошибка: {e!r}[/red]")
+        return EXIT_ERROR
+
+    if stats.failures and not args.quiet:
+        console.print(f"[dim]Неудачные попытки: {stats.failure_summary()}[/dim]")
+    if stats.favicon_fallbacks and not args.quiet:
+        console.print(f"[dim]Повторных запросов favicon: {stats.favicon_fallbacks}, "
+                      f"получено иконок: {stats.favicon_recovered}[/dim]")
+    if results and show:
+        print_summary(results)
+    if not args.quiet:
+        where = "stdout" if to_stdout else args.output
+        console.print(f"[bold green]✔ Найдено серверов: {len(results)}, результаты сохранены в {where}[/bold green]")
+    return EXIT_FOUND if results else EXIT_NOT_FOUND
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,35 +1,183 @@
 import asyncio
 import socket
-import json
-from datetime import datetime
 import logging
-from mcstatus import JavaServer
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from mcstatus import JavaServer, LegacyServer
 
-# Настройка логирования
-logging.basicConfig(
-    filename="scanner.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    encoding="utf-8"
-)
+from output import ResultWriter, JsonResultWriter, is_ndjson
+from records import ServerStatus, register_favicon
+from targets import parse_hosts, parse_ports, iter_targets, count_hosts, count_ports
 
-async def scan_port_async(ip, port, timeout=2.0, retries=2):
+# Логирование здесь не настраивается: это делает точка входа через logsetup.setup_logging
+
+class ScanStats:
+    # Счетчики одного сканирования; передаются в iter_scan и дальше в пробы
+    def __init__(self):
+        self.favicon_fallbacks = 0  # сколько раз понадобился повторный запрос favicon
+        self.favicon_recovered = 0  # сколько из них действительно вернули иконку
+        self.failures = {}  # (стадия, класс ошибки) -> количество
+        self.failure_time = {}  # (стадия, класс ошибки) -> секунд потрачено
+        self.retries = {}  # класс ошибки -> число повторов
+
+    def record_failure(self, stage, kind, elapsed=0.0):
+        key = (stage, kind)
+        self.failures[key] = self.failures.get(key, 0) + 1
+        self.failure_time[key] = self.failure_time.get(key, 0.0) + elapsed
+
+    def record_retry(self, kind):
+        self.retries[kind] = self.retries.get(kind, 0) + 1
+
+    def failure_summary(self):
+        # "connect/refused: 13842 (1.2 с), status/timeout: 3 (6.0 с)" - куда ушло время
+        return ", ".join(
+            f"{stage}/{kind}: {count} ({self.failure_time[(stage, kind)]:.1f} s)"
+            for (stage, kind), count in sorted(self.failures.items(), key=lambda item: -item[1])
+        )
+
+class ScanProgress:
+    # Счетчики завершенных проверок. Движок только увеличивает числа, без вызовов
+    # на каждый порт, а интерфейс сам опрашивает их с нужной частотой через sample()
+    def __init__(self, total=None):
+        self.total = total
+        self.completed = 0
+        self.found = 0
+        self.started = time.monotonic()
+        self.rate = 0.0  # проверок в секунду, сглаженное значение
+        self._last_time = self.started
+        self._last_completed = 0
+
+    def advance(self, found=False):
+        self.completed += 1
+        if found:
+            self.found += 1
+
+    def percent(self):
+        if not self.total:
+            return 0.0
+        return min(100.0, self.completed / self.total * 100)
+
+    def sample(self, smoothing=0.3):
+        # Скорость между соседними вызовами сглаживается экспоненциально;
+        # ETA - сколько секунд осталось при текущей скорости (None, если неизвестно)
+        now = time.monotonic()
+        if now > self._last_time:
+            instant = (self.completed - self._last_completed) / (now - self._last_time)
+            self.rate = instant if self._last_completed == 0 else self.rate + smoothing * (instant - self.rate)
+            self._last_time, self._last_completed = now, self.completed
+        eta = None
+        if self.total and self.rate > 0:
+            eta = max(0, self.total - self.completed) / self.rate
+        return self.percent(), self.rate, eta
+
+def classify_error(e):
+    # Классы ошибок соединения для политики повторов и статистики
+    if isinstance(e, (asyncio.TimeoutError, socket.timeout)):
+        return "timeout"
+    if isinstance(e, ConnectionRefusedError):
+        return "refused"  # RST на SYN: порт закрыт, повтор бессмыслен
+    if isinstance(e, (ConnectionResetError, ConnectionAbortedError, BrokenPipeError)):
+        return "reset"
+    if isinstance(e, socket.gaierror):
+        return "dns"
+    if isinstance(e, OSError):
+        return "network"
+    return "protocol"
+
+class RetryPolicy:
+    # Отдельный бюджет повторов на каждый класс ошибки.
+    # Закрытый порт (refused) не повторяем, таймауты повторяем с экспоненциальной
+    # задержкой и случайным разбросом, чтобы повторы не шли одной волной.
+    def __init__(self, timeout=1, reset=1, network=1, refused=0, dns=0, protocol=0,
+                 backoff=0.2, max_backoff=2.0, jitter=0.5):
+        self.budgets = {"timeout": timeout, "reset": reset, "network": network,
+                        "refused": refused, "dns": dns, "protocol": protocol}
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def should_retry(self, kind, spent):
+        # spent - сколько повторов этого класса уже сделано для текущей цели
+        return spent.get(kind, 0) < self.budgets.get(kind, 0)
+
+    def delay(self, kind, retry):
+        if kind != "timeout":
+            return 0
+        delay = min(self.max_backoff, self.backoff * 2 ** (retry - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+async def retry_or_give_up(kind, attempt, retries, spent, policy, stats):
+    # Общая логика повторов для scan_port_async и scanner.scan_port:
+    # возвращает True, если нужно сделать еще одну попытку
+    if attempt + 1 >= retries or not policy.should_retry(kind, spent):
+        return False
+    spent[kind] = spent.get(kind, 0) + 1
+    if stats:
+        stats.record_retry(kind)
+    delay = policy.delay(kind, spent[kind])
+    if delay:
+        await asyncio.sleep(delay)
+    return True
+
+async def connect_port(ip, port, timeout=0.5):
+    # Первая стадия: только TCP connect, без рукопожатия Minecraft.
+    # Возвращает None, если порт открыт, иначе класс ошибки (см. classify_error)
+    loop = asyncio.get_running_loop()
+    try:
+        async with asyncio.timeout(timeout):
+            transport, _ = await loop.create_connection(asyncio.Protocol, ip, port)
+    except (asyncio.TimeoutError, OSError) as e:
+        return classify_error(e)
+    transport.close()
+    return None
+
+async def fetch_favicon_async(server, timeout):
+    # Повторный статус-запрос только ради favicon - асинхронно, цикл событий не блокируется
+    async with asyncio.timeout(timeout):
+        status = await server.async_status(tries=1)
+    return status.icon
+
+async def fill_favicon(result, timeout, stats=None):
+    # Стадия догрузки favicon (favicon_retry): сервер ответил на статус без иконки -
+    # еще один асинхронный запрос только ради нее. Работает с любой пробой
+    if stats:
+        stats.favicon_fallbacks += 1
+    try:
+        favicon = await fetch_favicon_async(JavaServer(result.ip, result.port), timeout)
+    except Exception as e:
+        logging.warning(f"Favicon retry failed for {result.ip}:{result.port}: {e}",
+                        extra={"aggregate": "favicon retries failed"})
+        return result
+    logging.debug(f"Favicon retry on {result.ip}:{result.port}: {'Present' if favicon else 'None'}")
+    if favicon:
+        result.favicon_hash = register_favicon(favicon)
+        if stats:
+            stats.favicon_recovered += 1
+    return result
+
+def detect_core(version, default="Vanilla"):
+    for core in ("Paper", "Spigot", "Forge", "Fabric"):
+        if core in version:
+            return core
+    return default
+
+async def scan_port_async(ip, port, timeout=2.0, retries=2, stats=None, policy=None):
+    # retries - максимум попыток; сколько из них реально тратится, решает policy
+    policy = policy or DEFAULT_RETRY_POLICY
+    spent = {}
     for attempt in range(retries):
+        started = time.monotonic()
         try:
             server = JavaServer(ip, port)
             async with asyncio.timeout(timeout):
-                status = await server.async_status()
+                status = await server.async_status(tries=1)
 
-            # Получаем favicon, если async_status не вернул
+            # Если иконки нет, ее догружает стадия favicon_retry движка (fill_favicon)
             favicon = status.icon
-            if not favicon:
-                try:
-                    sync_status = server.status(timeout=timeout)
-                    favicon = sync_status.icon
-                    logging.info(f"Fallback to sync status for favicon on {ip}:{port}")
-                except Exception as e:
-                    logging.warning(f"Sync favicon fetch failed for {ip}:{port}: {e}")
-
             motd = status.description.to_minecraft() if hasattr(status.description, 'to_minecraft') else str(status.description)
             version = status.version.name
             protocol = status.version.protocol
@@ -39,79 +187,421 @@ async def scan_port_async(ip, port, timeout=2.0, retries=2):
             forge = status.forge_data is not None
             mods = [f"{m.name} {m.marker}" for m in status.forge_data.mods] if forge and hasattr(status.forge_data, "mods") else []
             plugins = status.software.plugins if hasattr(status, "software") and status.software.plugins else []
-            core = "Vanilla"
-            if "Paper" in version:
-                core = "Paper"
-            elif "Spigot" in version:
-                core = "Spigot"
-            elif "Forge" in version:
-                core = "Forge"
-            elif "Fabric" in version:
-                core = "Fabric"
+            core = detect_core(version)
             ping = status.latency
 
-            logging.info(f"Scanned {ip}:{port} - Favicon: {'Present' if favicon else 'None'}")
-            print(f"Raw favicon for {ip}:{port}: {favicon[:50] if favicon else 'None'}...")
-
-            return {
-                "ip": ip,
-                "port": port,
-                "motd": motd,
-                "version": version,
-                "protocol": protocol,
-                "players_online": players_online,
-                "players_max": players_max,
-                "players_sample": players_sample,
-                "forge": forge,
-                "mods": mods,
-                "plugins": plugins,
-                "core": core,
-                "favicon": favicon,
-                "ping": ping
-            }
-
-        except asyncio.TimeoutError:
-            logging.warning(f"Attempt {attempt + 1} timeout for {ip}:{port}")
-            continue
-        except (socket.gaierror, ConnectionRefusedError, OSError) as e:
-            logging.warning(f"Attempt {attempt + 1} failed for {ip}:{port}: {e}")
-            continue
+            logging.debug(f"Scanned {ip}:{port} - Favicon: {'Present' if favicon else 'None'}")
+
+            return ServerStatus(ip, port, motd, version, protocol, players_online, players_max, players_sample,
+                                forge, mods, plugins, core, favicon, ping)
+
+        except (asyncio.TimeoutError, socket.gaierror, OSError) as e:
+            kind = classify_error(e)
+            if stats:
+                stats.record_failure("status", kind, time.monotonic() - started)
+            # Частые события одного рода не пишутся по строке: LogSampler сводит их в счетчик
+            logging.info(f"Attempt {attempt + 1} {kind} for {ip}:{port}: {e}", extra={"aggregate": f"status attempts failed ({kind})"})
+            if not await retry_or_give_up(kind, attempt, retries, spent, policy, stats):
+                break
         except Exception as e:
-            logging.error(f"Error scanning {ip}:{port}: {e}")
+            if stats:
+                stats.record_failure("status", "protocol", time.monotonic() - started)
+            logging.warning(f"Error scanning {ip}:{port}: {e}", extra={"aggregate": "status protocol errors"})
             return None
 
-    logging.warning(f"All {retries} attempts failed for {ip}:{port}")
+    logging.info(f"All attempts failed for {ip}:{port}", extra={"aggregate": "status probes failed"})
     return None
 
-async def scan_ports(ip, start_port=25565, end_port=25600, timeout=2.0, concurrency=50, progress_callback=None):
-    results = []
-    total_ports = end_port - start_port + 1
-    semaphore = asyncio.Semaphore(concurrency)  # Ограничение параллельных задач
+async def legacy_ping_async(ip, port, timeout=2.0, stats=None):
+    # Серверы до 1.7 не понимают рукопожатие статуса и закрывают соединение:
+    # для открытых портов без ответа на статус - старый пинг 0xFE
+    started = time.monotonic()
+    try:
+        async with asyncio.timeout(timeout):
+            status = await LegacyServer(ip, port, timeout=timeout).async_status(tries=1)
+    except Exception as e:
+        if stats:
+            stats.record_failure("legacy", classify_error(e), time.monotonic() - started)
+        logging.debug(f"Legacy ping failed for {ip}:{port}: {e}", extra={"aggregate": "legacy pings failed"})
+        return None
+    version = status.version.name
+    logging.debug(f"Legacy server {ip}:{port}: {version}")
+    return ServerStatus(ip, port, status.motd.to_minecraft(), version, status.version.protocol,
+                        status.players.online, status.players.max, core=detect_core(version), ping=status.latency)
+
+async def query_async(ip, port, timeout=1.0, stats=None):
+    # UDP Query (GameSpy4), полная статистика: плагины, карта и весь список игроков.
+    # Работает только при enable-query=true; порт Query обычно совпадает с игровым
+    started = time.monotonic()
+    try:
+        server = JavaServer(ip, port, timeout=timeout, query_port=port)
+        async with asyncio.timeout(timeout * 2):  # рукопожатие + запрос статистики
+            return await server.async_query(tries=1)
+    except Exception as e:
+        if stats:
+            stats.record_failure("query", classify_error(e), time.monotonic() - started)
+        logging.debug(f"Query failed for {ip}:{port}: {e}", extra={"aggregate": "queries failed"})
+        return None
+
+def apply_query(result, query):
+    # Дополняет найденный сервер ответом Query
+    if query.software.plugins:
+        result.plugins = tuple(query.software.plugins)
+    if query.players.list:
+        result.players_sample = tuple(query.players.list)
+    result.map = query.map_name or None
+    if result.core == "Vanilla":
+        result.core = detect_core(query.software.brand)
+    return result
+
+class HostState:
+    __slots__ = ("window", "ssthresh", "inflight", "waiters", "rtts", "status_rtts", "last_decrease")
 
-    async def scan_with_semaphore(port):
-        async with semaphore:
-            result = await scan_port_async(ip, port, timeout)
-            if progress_callback:
-                current_progress = (port - start_port + 1) / total_ports * 100
-                await progress_callback(current_progress)
-            return result
+    def __init__(self, window):
+        self.window = window
+        self.ssthresh = float("inf")
+        self.inflight = 0
+        self.waiters = deque()
+        self.rtts = deque(maxlen=64)  # последние RTT подключения в секундах (в том числе RST)
+        # Время успешных запросов статуса: подключение отвечает ядро, а статус - сам сервер,
+        # поэтому таймаут статуса считается только по этим замерам
+        self.status_rtts = deque(maxlen=64)
+        self.last_decrease = 0.0
+
+class HostTuner:
+    # Ограничение и подстройка под каждый хост поверх общего лимита.
+    # Окно одновременных проверок меняется по AIMD: растет на каждый ответ,
+    # уменьшается вдвое при таймауте статуса на открытом порту хоста, который уже отвечал
+    # (признак перегрузки). Таймауты подключения окно не трогают: у живого хоста они
+    # означают отфильтрованный порт, а не перегрузку.
+    # Таймауты считаются как p99 * k по своим замерам: подключения - по RTT подключения,
+    # статуса - по времени успешных запросов статуса. Пока не набралось min_samples
+    # замеров, используются базовые значения. Хост без замеров и без активных проверок
+    # удаляется, поэтому при обходе больших подсетей словарь не растет.
+
+    def __init__(self, connect_timeout, timeout, max_window=None, adaptive=True,
+                 k=3.0, min_samples=5, min_window=1, min_connect_timeout=0.05, min_status_timeout=0.5,
+                 max_timeout_factor=2.0):
+        self.connect_timeout_base = connect_timeout
+        self.timeout_base = timeout
+        self.max_window = max_window
+        self.adaptive = adaptive
+        self.k = k
+        self.min_samples = min_samples
+        self.min_window = min_window
+        self.min_connect_timeout = min_connect_timeout
+        # Ответ на статус зависит еще и от скорости самого сервера, поэтому нижняя граница выше
+        self.min_status_timeout = min(min_status_timeout, timeout)
+        self.max_timeout_factor = max_timeout_factor
+        self.hosts = {}
+
+    def _state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            # Новый хост получает полное окно: таймауты у хоста, который ни разу не ответил,
+            # говорят о фильтрации портов, а не о перегрузке
+            state = self.hosts[host] = HostState(self.max_window or float("inf"))
+        return state
+
+    def _p99(self, samples):
+        samples = sorted(samples)
+        return samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+    def _adapt(self, samples, base, floor):
+        if not self.adaptive or samples is None or len(samples) < self.min_samples:
+            return base
+        timeout = self._p99(samples) * self.k
+        return min(max(timeout, floor), base * self.max_timeout_factor)
+
+    def connect_timeout(self, host):
+        state = self.hosts.get(host)
+        return self._adapt(state and state.rtts, self.connect_timeout_base, self.min_connect_timeout)
+
+    def status_timeout(self, host):
+        state = self.hosts.get(host)
+        return self._adapt(state and state.status_rtts, self.timeout_base, self.min_status_timeout)
+
+    def record_rtt(self, host, rtt):
+        # Любой ответ хоста (в том числе RST на закрытом порту) - замер RTT и повод расширить окно
+        state = self.hosts.get(host)
+        if state is None or not self.adaptive:
+            return
+        state.rtts.append(rtt)
+        self._grow(state)
+
+    def record_status(self, host, elapsed):
+        # Успешный запрос статуса: замер для таймаута статуса и тоже повод расширить окно
+        state = self.hosts.get(host)
+        if state is None or not self.adaptive:
+            return
+        state.status_rtts.append(elapsed)
+        self._grow(state)
+
+    def _grow(self, state):
+        if state.window < (self.max_window or float("inf")):
+            state.window += 1 if state.window < state.ssthresh else 1 / state.window
+            if self.max_window:
+                state.window = min(state.window, self.max_window)
+            self._wake(state)
+
+    def record_timeout(self, host):
+        # Только для портов, про которые известно, что они открыты (стадия статуса)
+        state = self.hosts.get(host)
+        if state is None or not self.adaptive or not (state.rtts or state.status_rtts):
+            return
+        now = time.monotonic()
+        # Уменьшаем окно не чаще раза за таймаут: пачка одновременных потерь - одно событие
+        if now - state.last_decrease < self.status_timeout(host):
+            return
+        state.last_decrease = now
+        if state.window == float("inf"):
+            state.window = max(state.inflight, self.min_window)
+        state.window = max(self.min_window, state.window / 2)
+        state.ssthresh = state.window
+
+    def _wake(self, state):
+        free = state.window - state.inflight
+        while free >= 1 and state.waiters:
+            waiter = state.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    @asynccontextmanager
+    async def hold(self, host):
+        if not self.max_window and not self.adaptive:
+            yield
+            return
+        state = self._state(host)
+        while state.inflight + 1 > max(1, state.window):
+            waiter = asyncio.get_running_loop().create_future()
+            state.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in state.waiters:
+                    state.waiters.remove(waiter)
+                raise
+        state.inflight += 1
+        try:
+            yield
+        finally:
+            state.inflight -= 1
+            self._wake(state)
+            if not state.inflight and not state.waiters and not state.rtts and not state.status_rtts:
+                self.hosts.pop(host, None)
+
+async def scan_pipeline(targets, on_done, probe=scan_port_async, timeout=2.0, concurrency=50,
+                        connect_timeout=0.5, connect_concurrency=1000, per_host_limit=None, stats=None,
+                        adaptive=True, legacy=False, legacy_timeout=2.0, legacy_concurrency=20,
+                        query=False, query_timeout=1.0, query_concurrency=20, favicon_retry=False):
+    # Пул воркеров вместо задачи на каждый порт: память и нагрузка на планировщик
+    # зависят только от concurrency, а не от размера диапазона.
+    # targets - любой (в том числе ленивый) итератор пар (ip, port),
+    # on_done(ip, port, result) вызывается для каждой цели по мере готовности.
+    # per_host_limit ограничивает число одновременных проверок одного хоста.
+    # stats (ScanStats) передается в probe для подсчета событий.
+    # adaptive - подстройка таймаутов и окна каждого хоста по замеренному RTT (HostTuner),
+    # timeout и connect_timeout при этом служат начальными значениями.
+    # Дополнительные стадии со своими воркерами и таймаутами, только для открытых портов:
+    # legacy - старый пинг 0xFE для портов, не ответивших на статус (серверы до 1.7),
+    # query - UDP Query для уже найденных серверов (плагины, карта, все игроки).
+    # favicon_retry - повторный запрос статуса ради favicon, если сервер ответил без иконки.
+    targets = iter(targets)
+    open_ports = asyncio.Queue(maxsize=concurrency * 2)
+    legacy_ports = asyncio.Queue(maxsize=legacy_concurrency * 2) if legacy else None
+    found_servers = asyncio.Queue(maxsize=query_concurrency * 2) if query else None
+    tuner = HostTuner(connect_timeout, timeout, max_window=per_host_limit, adaptive=adaptive)
+
+    async def guarded(stage, ip, port, call):
+        # Исключение в пробе (в том числе в подключаемой через probe=) - неудача одной цели,
+        # а не гибель воркера: иначе gather в drain() оборвет все сканирование
+        started = time.monotonic()
+        try:
+            return await call
+        except Exception as e:
+            if stats:
+                stats.record_failure(stage, "error", time.monotonic() - started)
+            logging.error(f"Unexpected {stage} error for {ip}:{port}: {e!r}", extra={"aggregate": f"{stage} errors"})
+            return None
+
+    async def finish(ip, port, result):
+        # Сервер, найденный статусом или старым пингом, еще проходит через Query
+        if result is not None and found_servers is not None:
+            await found_servers.put(result)
+        else:
+            await on_done(ip, port, result)
+
+    async def connect_worker():
+        # next() синхронный, поэтому общий итератор безопасно делить между воркерами
+        for ip, port in targets:
+            async with tuner.hold(ip):
+                started = time.monotonic()
+                timeout = tuner.connect_timeout(ip)
+                failure = await connect_port(ip, port, timeout)
+                if failure == "timeout" and timeout < connect_timeout:
+                    # Подстроенный таймаут короче заданного: один потерянный SYN не должен
+                    # стоить найденного сервера, поэтому повторяем с заданным таймаутом
+                    if stats:
+                        stats.record_retry("timeout")
+                    attempt = time.monotonic()
+                    failure = await connect_port(ip, port, connect_timeout)
+                else:
+                    attempt = started
+                elapsed = time.monotonic() - started
+                if failure in (None, "refused"):
+                    tuner.record_rtt(ip, time.monotonic() - attempt)
+            if failure is None:
+                await open_ports.put((ip, port))
+            else:
+                if stats:
+                    stats.record_failure("connect", failure, elapsed)
+                await on_done(ip, port, None)
+
+    async def status_worker():
+        while True:
+            target = await open_ports.get()
+            if target is None:
+                return
+            ip, port = target
+            async with tuner.hold(ip):
+                started = time.monotonic()
+                timeout = tuner.status_timeout(ip)
+                result = await guarded("status", ip, port, probe(ip, port, timeout, stats=stats))
+                elapsed = time.monotonic() - started
+                if result is not None:
+                    tuner.record_status(ip, elapsed)
+                elif elapsed >= timeout:
+                    # Открытый порт не ответил за таймаут хотя бы одной попытки - признак перегрузки
+                    tuner.record_timeout(ip)
+                if result is not None and favicon_retry and not result.favicon_hash:
+                    result = await guarded("favicon", ip, port, fill_favicon(result, timeout, stats)) or result
+            if result is None and legacy_ports is not None:
+                await legacy_ports.put((ip, port))
+            else:
+                await finish(ip, port, result)
+
+    async def legacy_worker():
+        while True:
+            target = await legacy_ports.get()
+            if target is None:
+                return
+            ip, port = target
+            async with tuner.hold(ip):
+                result = await guarded("legacy", ip, port, legacy_ping_async(ip, port, legacy_timeout, stats=stats))
+            await finish(ip, port, result)
+
+    async def query_worker():
+        while True:
+            result = await found_servers.get()
+            if result is None:
+                return
+            async with tuner.hold(result.ip):
+                response = await guarded("query", result.ip, result.port,
+                                         query_async(result.ip, result.port, query_timeout, stats=stats))
+            if response is not None:
+                apply_query(result, response)
+            await on_done(result.ip, result.port, result)
+
+    async def drain(queue, workers):
+        # Стадия завершается после предыдущей: по сигналу остановки на каждого воркера
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    connect_workers = [asyncio.create_task(connect_worker()) for _ in range(connect_concurrency)]
+    status_workers = [asyncio.create_task(status_worker()) for _ in range(concurrency)]
+    legacy_workers = [asyncio.create_task(legacy_worker()) for _ in range(legacy_concurrency if legacy else 0)]
+    query_workers = [asyncio.create_task(query_worker()) for _ in range(query_concurrency if query else 0)]
+    try:
+        await asyncio.gather(*connect_workers)
+        await drain(open_ports, status_workers)
+        if legacy:
+            await drain(legacy_ports, legacy_workers)
+        if query:
+            await drain(found_servers, query_workers)
+    finally:
+        for task in connect_workers + status_workers + legacy_workers + query_workers:
+            task.cancel()
+
+async def iter_scan(targets, probe=scan_port_async, timeout=2.0, concurrency=50, progress_callback=None,
+                    total=None, connect_timeout=0.5, connect_concurrency=1000, per_host_limit=None, stats=None,
+                    adaptive=True, progress=None, progress_interval=0.2, **stages):
+    # Асинхронный генератор: отдает каждый найденный сервер сразу после ответа,
+    # не дожидаясь окончания всего диапазона.
+    # progress (ScanProgress) считает завершенные проверки; progress_callback
+    # получает процент не чаще раза в progress_interval секунд и в самом конце.
+    # stages - параметры стадий legacy и query (см. scan_pipeline)
+    found = asyncio.Queue()
+    done = object()
+    if progress is None:
+        progress = ScanProgress(total)
+    elif progress.total is None:
+        progress.total = total
+    last_report = 0.0
+
+    async def on_done(ip, port, result):
+        nonlocal last_report
+        progress.advance(result is not None)
+        if result is not None:
+            found.put_nowait(result)
+        if progress_callback and progress.total:
+            now = time.monotonic()
+            if now - last_report >= progress_interval or progress.completed >= progress.total:
+                last_report = now
+                await progress_callback(progress.percent())
+
+    async def run():
+        try:
+            await scan_pipeline(targets, on_done, probe=probe, timeout=timeout, concurrency=concurrency,
+                                connect_timeout=connect_timeout, connect_concurrency=connect_concurrency,
+                                per_host_limit=per_host_limit, stats=stats, adaptive=adaptive, **stages)
+        finally:
+            found.put_nowait(done)
+
+    pipeline = asyncio.create_task(run())
+    try:
+        while True:
+            result = await found.get()
+            if result is done:
+                break
+            yield result
+        # Пробрасываем исключение движка, если он упал
+        await pipeline
+    finally:
+        pipeline.cancel()
 
-    tasks = [scan_with_semaphore(port) for port in range(start_port, end_port + 1)]
-    results = await asyncio.gather(*tasks, return_exceptions=False)
-    results = [r for r in results if r is not None]
+async def scan_ports(ip, start_port=25565, end_port=25600, timeout=2.0, concurrency=50, progress_callback=None,
+                     connect_timeout=0.5, connect_concurrency=1000, per_host_limit=None, ports=None,
+                     favicon_retry=False, stats=None, adaptive=True, progress=None, probe=None, **stages):
+    # ip может быть одиночным адресом или списком целей (подсети, диапазоны, имена хостов),
+    # ports - набором портов вида "25565,36000-50000" вместо start_port/end_port.
+    # probe - другая реализация запроса статуса, например raw_status.RawStatusProber()
+    hosts = parse_hosts(ip)
+    ports = parse_ports(ports) if ports else [(start_port, end_port)]
+    stats = stats or ScanStats()
+    probe = probe or scan_port_async
+    results = [r async for r in iter_scan(iter_targets(hosts, ports), probe=probe, timeout=timeout,
+                                          concurrency=concurrency, progress_callback=progress_callback,
+                                          total=count_hosts(hosts) * count_ports(ports),
+                                          connect_timeout=connect_timeout, connect_concurrency=connect_concurrency,
+                                          per_host_limit=per_host_limit, stats=stats, adaptive=adaptive,
+                                          progress=progress, favicon_retry=favicon_retry, **stages)]
 
     logging.info(f"Scan completed: {len(results)} servers found")
+    if stats.favicon_fallbacks:
+        logging.info(f"Favicon retries: {stats.favicon_fallbacks}, recovered: {stats.favicon_recovered}")
+    if stats.failures:
+        logging.info(f"Failures: {stats.failure_summary()}; retries: {stats.retries}")
     return results
 
 def save_results(results, filename="results.json"):
-    data = {
-        "scanned_at": datetime.utcnow().isoformat(),
-        "servers_found": len(results),
-        "results": results
-    }
+    # .ndjson/.jsonl (в том числе .gz/.zst) - по строке на сервер, иначе компактный JSON-документ
     try:
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        writer = ResultWriter(filename, fsync_every=0) if is_ndjson(filename) else JsonResultWriter(filename)
+        with writer:
+            for r in results:
+                writer.write(r)
         logging.info(f"Results saved to {filename}")
     except Exception as e:
-        logging.error(f"Error saving results to {filename}: {e}")
\ No newline at end of file
+        logging.error(f"Error saving results to {filename}: {e}")
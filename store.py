@@ -0,0 +1,198 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from records import ServerStatus
+
+# Хранилище истории сканирований в SQLite: запись только добавлением,
+# favicon хранится один раз по хешу, история читается постранично
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    time TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    ports TEXT NOT NULL,
+    servers INTEGER NOT NULL,
+    mode TEXT NOT NULL DEFAULT 'full'
+);
+CREATE TABLE IF NOT EXISTS servers (
+    id INTEGER PRIMARY KEY,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    UNIQUE (ip, port)
+);
+CREATE TABLE IF NOT EXISTS favicons (
+    hash TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    server_id INTEGER NOT NULL REFERENCES servers (id),
+    time TEXT NOT NULL,
+    motd TEXT,
+    version TEXT,
+    protocol INTEGER,
+    players_online INTEGER,
+    players_max INTEGER,
+    players_sample TEXT,
+    forge INTEGER,
+    mods TEXT,
+    plugins TEXT,
+    core TEXT,
+    favicon_hash TEXT REFERENCES favicons (hash),
+    ping REAL,
+    map TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_scans_time ON scans (time);
+CREATE INDEX IF NOT EXISTS idx_observations_scan ON observations (scan_id);
+CREATE INDEX IF NOT EXISTS idx_observations_server_time ON observations (server_id, time);
+CREATE INDEX IF NOT EXISTS idx_observations_time ON observations (time);
+"""
+
+class ResultStore:
+    def __init__(self, path="history.db"):
+        # Запись идет из потока сканирования, чтение - из потока Tk
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            # Базы, созданные до появления UDP Query, дополняются колонкой карты
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(observations)")}
+            if "map" not in columns:
+                self.conn.execute("ALTER TABLE observations ADD COLUMN map TEXT")
+            # ...и колонкой режима: ports всегда остается диапазоном портов, а то,
+            # что проверялись только горячие цели, хранится отдельно (mode = 'hot')
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(scans)")}
+            if "mode" not in columns:
+                self.conn.execute("ALTER TABLE scans ADD COLUMN mode TEXT NOT NULL DEFAULT 'full'")
+                self.conn.execute(
+                    "UPDATE scans SET ports = substr(ports, 1, instr(ports, ' (горячие:') - 1), mode = 'hot' "
+                    "WHERE instr(ports, ' (горячие:') > 0"
+                )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def add_scan(self, ip, ports, results, time=None, mode="full"):
+        # mode: "full" - весь диапазон ports, "hot" - только горячие цели из него
+        time = time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            scan_id = self.conn.execute(
+                "INSERT INTO scans (time, ip, ports, servers, mode) VALUES (?, ?, ?, ?, ?)",
+                (time, ip, ports, len(results), mode)
+            ).lastrowid
+            for r in results:
+                self._add_observation(scan_id, time, r)
+        return scan_id
+
+    def _add_observation(self, scan_id, time, r):
+        r = ServerStatus.from_dict(r)
+        self.conn.execute(
+            "INSERT INTO servers (ip, port, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (ip, port) DO UPDATE SET last_seen = excluded.last_seen",
+            (r["ip"], r["port"], time, time)
+        )
+        server_id = self.conn.execute(
+            "SELECT id FROM servers WHERE ip = ? AND port = ?", (r["ip"], r["port"])
+        ).fetchone()[0]
+        icon_hash = r.favicon_hash
+        if icon_hash and r.favicon:
+            self.conn.execute("INSERT OR IGNORE INTO favicons (hash, data) VALUES (?, ?)", (icon_hash, r.favicon))
+        self.conn.execute(
+            "INSERT INTO observations (scan_id, server_id, time, motd, version, protocol, players_online, "
+            "players_max, players_sample, forge, mods, plugins, core, favicon_hash, ping, map) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (scan_id, server_id, time, r["motd"], r["version"], r["protocol"], r["players_online"],
+             r["players_max"], json.dumps(r["players_sample"], ensure_ascii=False), int(r["forge"]),
+             json.dumps(r["mods"], ensure_ascii=False), json.dumps(r["plugins"], ensure_ascii=False),
+             r["core"], icon_hash, r["ping"], r.map)
+        )
+
+    def count_scans(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM scans").fetchone()[0]
+
+    def list_scans(self, offset=0, limit=100):
+        # Новые сканирования первыми
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, time, ip, ports, servers, mode FROM scans ORDER BY id DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_scan(self, scan_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, time, ip, ports, servers, mode FROM scans WHERE id = ?", (scan_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def latest_scan(self):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, time, ip, ports, servers, mode FROM scans ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        return dict(row) if row else None
+
+    def latest_scan_id(self):
+        # Хранилище только дополняется, поэтому номер последнего скана - версия всех данных
+        with self.lock:
+            row = self.conn.execute("SELECT MAX(id) FROM scans").fetchone()
+        return row[0] or 0
+
+    def load_scan(self, scan_id, offset=0, limit=None, favicons=True):
+        # favicons=False - без самих иконок, только favicon_hash (для API)
+        favicon = "f.data" if favicons else "NULL"
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT s.ip, s.port, o.*, {favicon} AS favicon FROM observations o "
+                "JOIN servers s ON s.id = o.server_id "
+                "LEFT JOIN favicons f ON f.hash = o.favicon_hash "
+                "WHERE o.scan_id = ? ORDER BY o.id LIMIT ? OFFSET ?",
+                (scan_id, -1 if limit is None else limit, offset)
+            ).fetchall()
+        if favicons:
+            return [self._row_to_result(row) for row in rows]
+        return [self._row_to_result(row).to_dict(favicon=False) for row in rows]
+
+    def get_favicon(self, icon_hash):
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM favicons WHERE hash = ?", (icon_hash,)).fetchone()
+        return row[0] if row else None
+
+    def server_history(self, ip, port, offset=0, limit=100):
+        # Временной ряд наблюдений одного сервера, новые первыми
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT s.ip, s.port, o.*, NULL AS favicon FROM observations o "
+                "JOIN servers s ON s.id = o.server_id "
+                "WHERE s.ip = ? AND s.port = ? ORDER BY o.time DESC, o.id DESC LIMIT ? OFFSET ?",
+                (ip, port, limit, offset)
+            ).fetchall()
+        return [dict(self._row_to_result(row).to_dict(favicon=False), time=row["time"], scan_id=row["scan_id"])
+                for row in rows]
+
+    def _row_to_result(self, row):
+        return ServerStatus(
+            row["ip"], row["port"], row["motd"], row["version"], row["protocol"],
+            row["players_online"], row["players_max"], json.loads(row["players_sample"] or "[]"),
+            row["forge"], json.loads(row["mods"] or "[]"), json.loads(row["plugins"] or "[]"),
+            row["core"], row["favicon"], row["ping"], row["map"], favicon_hash=row["favicon_hash"]
+        )
+
+    def import_history_json(self, filename="history.json"):
+        # Однократный перенос старой истории (history.json) в базу
+        with open(filename, "r", encoding="utf-8") as f:
+            history = json.load(f)
+        for entry in history:
+            self.add_scan(entry["ip"], entry["ports"], entry.get("results", []), time=entry["time"])
+        return len(history)
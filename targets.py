@@ -0,0 +1,106 @@
+import ipaddress
+import re
+
+# Разделители в списках целей: запятые, пробелы, переводы строк
+_SEPARATORS = re.compile(r"[,\s]+")
+
+def _split(spec):
+    return [part for part in _SEPARATORS.split(spec.strip()) if part]
+
+def parse_ports(spec):
+    # "25565", "36000-50000", "25565,25570-25580" -> список диапазонов (start, end)
+    ranges = []
+    for part in _split(str(spec)):
+        if "-" in part:
+            start, end = part.split("-", 1)
+            start, end = int(start), int(end)
+        else:
+            start = end = int(part)
+        if start < 1 or end > 65535 or start > end:
+            raise ValueError(f"Недопустимый диапазон портов: {part}")
+        ranges.append((start, end))
+    if not ranges:
+        raise ValueError("Не указаны порты")
+    return ranges
+
+def parse_hosts(spec):
+    # Поддерживаются: одиночные IP, подсети CIDR (10.0.0.0/24),
+    # диапазоны IP (10.0.0.1-10.0.0.50 или 10.0.0.1-50), имена хостов
+    # и @файл со списком целей (по одной или через запятую)
+    hosts = []
+    for part in _split(spec):
+        if part.startswith("@"):
+            with open(part[1:], "r", encoding="utf-8") as f:
+                hosts.extend(parse_hosts(f.read()))
+        elif "/" in part:
+            try:
+                hosts.append(ipaddress.ip_network(part, strict=False))
+            except ValueError:
+                raise ValueError(f"Недопустимая подсеть: {part}")
+        elif "-" in part and _is_ip(part.split("-", 1)[0]):
+            start, end = part.split("-", 1)
+            start = ipaddress.ip_address(start)
+            if "." not in end and ":" not in end:
+                # Короткая запись: 10.0.0.1-50
+                end = str(start).rsplit(".", 1)[0] + "." + end
+            try:
+                end = ipaddress.ip_address(end)
+            except ValueError:
+                raise ValueError(f"Недопустимый диапазон IP: {part}")
+            if end.version != start.version or end < start:
+                raise ValueError(f"Недопустимый диапазон IP: {part}")
+            hosts.append((start, end))
+        else:
+            hosts.append(part)
+    if not hosts:
+        raise ValueError("Не указаны IP-адреса")
+    return hosts
+
+def _is_ip(value):
+    try:
+        ipaddress.ip_address(value)
+        return True
+    except ValueError:
+        return False
+
+def iter_hosts(hosts):
+    # Ленивое развертывание: подсеть /16 не превращается в список из 65536 строк
+    for host in hosts:
+        if isinstance(host, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            for address in host.hosts():
+                yield str(address)
+        elif isinstance(host, tuple):
+            start, end = host
+            for value in range(int(start), int(end) + 1):
+                yield str(ipaddress.ip_address(value))
+        else:
+            yield host
+
+def iter_ports(ports):
+    for start, end in ports:
+        yield from range(start, end + 1)
+
+def count_hosts(hosts):
+    total = 0
+    for host in hosts:
+        if isinstance(host, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            # hosts() не включает адрес сети и broadcast (для IPv6 - только адрес сети), кроме /31 и /32
+            if host.num_addresses <= 2:
+                total += host.num_addresses
+            else:
+                total += host.num_addresses - (2 if host.version == 4 else 1)
+        elif isinstance(host, tuple):
+            total += int(host[1]) - int(host[0]) + 1
+        else:
+            total += 1
+    return total
+
+def count_ports(ports):
+    return sum(end - start + 1 for start, end in ports)
+
+def iter_targets(hosts, ports):
+    # Порт во внешнем цикле: соседние цели приходятся на разные хосты,
+    # поэтому нагрузка равномерно распределяется по всем адресам
+    for port in iter_ports(ports):
+        for host in iter_hosts(hosts):
+            yield host, port